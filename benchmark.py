@@ -0,0 +1,219 @@
+""" benchmarks on synthetic myfitnesspal data
+
+    python benchmark.py search --years 20
+    python benchmark.py pdf --years 1 --repeat 5
+    python benchmark.py fetch --latency 0.01 --jitter 0.005 --error-rate 0.01
+    python benchmark.py chunked --years 30 --budget 64
+    python benchmark.py compression --years 10 --repeat 5
+"""
+# pylint: disable=import-outside-toplevel
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from mfp import MFPReport
+from synthetic import FakeClient, write_diary
+
+FETCH_DAYS = (30, 365, 3650)
+
+
+def timed(function, *args, repeat: int=1, **kwargs):
+    """ run function repeat times, return the last result and the mean seconds """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args, **kwargs)
+    return result, (time.perf_counter() - start) / repeat
+
+def directory_report(directory: str) -> MFPReport:
+    """ MFPReport with all its files in directory """
+    mfp = MFPReport()
+    for key, value in vars(mfp).items():
+        if key.endswith('_file') and key != 'report_css_file':
+            setattr(mfp, key, str(Path(directory, Path(value).name)))
+    return mfp
+
+def synthetic_report(directory: str, years: int, suffix: str='') -> MFPReport:
+    """ MFPReport with all its files in directory and a synthetic diary of years,
+        suffix .gz or .zst compresses the csv """
+    mfp = directory_report(directory)
+    mfp.mfp_csv_file += suffix
+    start_date = dt.date.today() - dt.timedelta(days=int(years * 365.25))
+    _, seconds = timed(write_diary, mfp, start_date, (dt.date.today() - start_date).days)
+    size = Path(mfp.mfp_csv_file).stat().st_size
+    print(f"synthetic diary: {years} years, {size / 1024 / 1024:.1f} MiB in {seconds:.2f}s")
+    return mfp
+
+def bench_search(years: int, repeat: int, **_) -> None:
+    """ build the inverted index and time term and prefix queries """
+    from search import update_search_index, load_search_index, search
+
+    with tempfile.TemporaryDirectory() as directory:
+        mfp = synthetic_report(directory, years)
+
+        # index all but the last day, then the last day incrementally
+        last_date = mfp.last_csv_date()
+        with open(mfp.mfp_csv_file, 'rb+') as file:
+            index = mfp.load_index()
+            tail_offset = mfp.date_offset(index, last_date)
+            file.seek(tail_offset)
+            tail = file.read()
+            file.truncate(tail_offset)
+        _, seconds = timed(update_search_index, mfp)
+        print(f"build index:            {seconds * 1000:9.1f} ms")
+        with open(mfp.mfp_csv_file, 'ab') as file:
+            file.write(tail)
+        _, seconds = timed(update_search_index, mfp)
+        print(f"append one day:         {seconds * 1000:9.1f} ms")
+        size = Path(mfp.search_index_file()).stat().st_size
+        print(f"index size:             {size / 1024:9.1f} KiB")
+
+        index, seconds = timed(load_search_index, mfp, repeat=repeat)
+        print(f"load index:             {seconds * 1000:9.1f} ms")
+        for terms in (['pizza'], ['pizz*'], ['beer'], ['chicken', 'grilled'], ['c*']):
+            df_result, seconds = timed(search, index, terms, 'year', repeat=repeat)
+            print(f"search {' '.join(terms):<16}{seconds * 1000:9.1f} ms  "
+                  f"{df_result['entries'].sum()} entries, {df_result['calories'].sum()} kcal")
+
+def bench_pdf(years: int, repeat: int, **_) -> None:
+    """ render the weekly pdf report with wkhtmltopdf and with the native renderer,
+        both include building the table, which is timed on its own as well """
+    from report import pdf_report, df_to_xml
+
+    with tempfile.TemporaryDirectory() as directory:
+        mfp = synthetic_report(directory, years)
+        end_date = dt.datetime.combine(mfp.last_csv_date(), dt.time())
+        start_date = end_date - dt.timedelta(days=6)
+        df_mfp = mfp.load_df(start_date, end_date)
+        _, seconds = timed(df_to_xml, mfp, df_mfp, start_date, end_date, repeat=repeat)
+        print(f"{'table':<8}{seconds * 1000:9.1f} ms")
+        results = {}
+        for renderer in ('pdfkit', 'native'):
+            mfp.pdf_renderer = renderer
+            try:
+                buf, results[renderer] = timed(pdf_report, mfp, df_mfp, end_date, repeat=repeat)
+            except OSError as error:
+                print(f"{renderer:<8} not available: {error}")
+                continue
+            size = len(buf.getvalue())
+            print(f"{renderer:<8}{results[renderer] * 1000:9.1f} ms  {size / 1024:.1f} KiB")
+        if len(results) == 2:
+            print(f"native is {results['pdfkit'] / results['native']:.1f}x as fast as pdfkit")
+
+def bench_fetch(latency: float, jitter: float, error_rate: float, rate_limit: float,
+                concurrency: int, rate_max: float, **_) -> None:
+    """ backfill an empty csv from the fake client, days/sec and request latency percentiles """
+    for days in FETCH_DAYS:
+        with tempfile.TemporaryDirectory() as directory:
+            mfp = directory_report(directory)
+            mfp.fetch_concurrency = concurrency
+            mfp.fetch_rate_max = rate_max
+            mfp.fetch_backoff = 0.1
+            client = FakeClient(latency=latency, jitter=jitter, error_rate=error_rate,
+                                rate_limit=rate_limit)
+            start_date = dt.date.today() - dt.timedelta(days=days)
+            with contextlib.redirect_stdout(io.StringIO()):
+                summary = mfp.to_csv(start_date=start_date, client=client)
+            failure = f"  stopped: {summary['stopped']}" if 'stopped' in summary else ""
+            fetched = len(mfp.load_index()['dates'])
+            p50, p95, p99 = np.percentile(client.latencies, [50, 95, 99]) * 1000
+            slowest = max(client.latencies) * 1000
+            seconds = summary['seconds']
+            print(f"{fetched:5}/{days:<5} days {seconds:8.2f}s {fetched / seconds:8.1f} days/s  "
+                  f"p50 {p50:6.1f} p95 {p95:6.1f} p99 {p99:6.1f} max {slowest:6.1f} ms  "
+                  f"{summary['retries']} retries {summary['errors']} errors "
+                  f"{summary['throttled']} throttled{failure}")
+
+def bench_chunked(years: int, budget: int, **_) -> None:
+    """ build the dense totals and the normalized tables in one go and within a memory budget """
+    from dense import update_dense
+    from foods import update_foods
+
+    with tempfile.TemporaryDirectory() as directory:
+        mfp = synthetic_report(directory, years)
+        mfp.load_index()
+        results = {}
+        for memory_budget in (0, budget):
+            mfp.memory_budget = memory_budget
+            for filename in (mfp.dense_file(), mfp.foods_csv_file(), mfp.entries_csv_file(),
+                             mfp.totals_csv_file()):
+                Path(filename).unlink(missing_ok=True)
+            tracemalloc.start()
+            _, seconds = timed(lambda: (update_dense(mfp), update_foods(mfp)))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[memory_budget] = (update_dense(mfp).frame(),
+                                      Path(mfp.entries_csv_file()).read_bytes())
+            label = "whole csv"
+            if memory_budget:
+                label = f"budget {memory_budget} MiB, {len(mfp.chunks())} chunks"
+            print(f"{label:<26}{seconds:8.2f}s  peak {peak / 1024 / 1024:8.1f} MiB")
+        same = results[0][0].equals(results[budget][0]) and results[0][1] == results[budget][1]
+        print(f"same dense totals and entries: {same}")
+
+def drop_cache(filename: str) -> None:
+    """ write filename to disk and evict it from the page cache, the next read is cold """
+    with open(filename, 'rb') as file:
+        os.fsync(file.fileno())
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def bench_compression(years: int, repeat: int, **_) -> None:
+    """ csv size and load_df time plain, gzip and zstd compressed,
+        with a cold and a warm page cache """
+    with tempfile.TemporaryDirectory() as directory:
+        plain = 0
+        for suffix in ('', '.gz', '.zst'):
+            mfp = synthetic_report(directory, years, suffix)
+            size = Path(mfp.mfp_csv_file).stat().st_size
+            plain = plain or size
+            print(f"{suffix or 'plain':<6}{size / 1024 / 1024:9.1f} MiB  "
+                  f"{plain / size:5.1f}x smaller")
+            end_date = dt.datetime.combine(mfp.last_csv_date(), dt.time())
+            week = (end_date - dt.timedelta(days=6), end_date)
+            for label, dates in (('all', (None, None)), ('week', week)):
+                cold = []
+                for _ in range(repeat):
+                    drop_cache(mfp.mfp_csv_file)
+                    cold.append(timed(mfp.load_df, *dates, cache=False)[1])
+                _, warm = timed(mfp.load_df, *dates, cache=False, repeat=repeat)
+                print(f"  load {label:<5} cold {np.median(cold) * 1000:9.1f} ms  "
+                      f"warm {warm * 1000:9.1f} ms")
+
+BENCHMARKS = {
+    'search': bench_search,
+    'pdf': bench_pdf,
+    'fetch': bench_fetch,
+    'chunked': bench_chunked,
+    'compression': bench_compression,
+}
+
+def main():
+    """ run one benchmark from the command line """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=BENCHMARKS.keys())
+    parser.add_argument("--years", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.01, help="fetch: seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.005,
+                        help="fetch: extra random seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fetch: fraction of failing requests")
+    parser.add_argument("--rate-limit", type=float, default=0,
+                        help="fetch: requests per second before throttling")
+    parser.add_argument("--concurrency", type=int, default=4, help="fetch: most requests in flight")
+    parser.add_argument("--budget", type=int, default=64, help="chunked: memory budget in MiB")
+    parser.add_argument("--rate-max", type=float, default=500,
+                        help="fetch: requests per second at most")
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](**vars(args))
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,40 @@
 """ reports for myfitnesspal data """
 # pylint: disable=broad-except
 # pylint: disable=import-outside-toplevel
+# pylint: disable=logging-fstring-interpolation
 
 import argparse
 import logging
 import sys
+import time
+from pathlib import Path
 
 from rich.console import Console
 from rich.logging import RichHandler
 
-from commands import COMMANDS, get_command_list, load_config
+import metrics
 
 logger = logging.getLogger(__name__)
 
 
 def main(args=None):
-    """ run from command line """
+    """ run from command line, in the warm worker (worker.py) when one is listening """
 
     if args is None:
         args = sys.argv[1:]
+    if "--no-worker" not in args:
+        # worker.py imports cmdline to run the commands
+        import worker       # pylint: disable=cyclic-import
+        code = worker.forward(args)
+        if code is not None:
+            sys.exit(code)
+    run(args)
+
+def run(args: list):
+    """ run a command in this process """
+
+    from commands import COMMANDS, get_command_list, load_config, mfp
+    from mfp import wait_for_sync
 
     parser = argparse.ArgumentParser(
         epilog=get_command_list(), formatter_class=argparse.RawDescriptionHelpFormatter
@@ -28,7 +44,14 @@ def main(args=None):
     parser.add_argument("--loglevel", type=str, default="INFO")
     parser.add_argument("--traceback-locals", action="store_true")
     parser.add_argument("--debugger", action="store_true")
-    args, extra = parser.parse_known_args()
+    parser.add_argument("--offline", action="store_true",
+                        help="report from the csv without syncing")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="directory of the prometheus textfile collector, "
+                             "writes mfp_<command>_<config>.prom")
+    parser.add_argument("--no-worker", action="store_true",
+                        help="run here even when worker.py is listening")
+    args, extra = parser.parse_known_args(args)
 
     # Set up a simple console logger
     logging.basicConfig(level=args.loglevel)
@@ -36,6 +59,8 @@ def main(args=None):
     console = Console()
 
     load_config(args.configfile)
+    if args.offline:
+        mfp.sync_policy = 'offline'
 
     if args.debugger:
         import debugpy
@@ -51,9 +76,12 @@ def main(args=None):
         handlers=[RichHandler()],
     )
 
+    start = time.perf_counter()
+    success = False
     try:
         if args.command[0] in COMMANDS:
             COMMANDS[args.command[0]]["function"](args, *extra)
+        success = True
     except Exception:
         console.print_exception(show_locals=args.traceback_locals)
         console.print(
@@ -63,6 +91,17 @@ def main(args=None):
             "including the above traceback and a description of what "
             "you were trying to accomplish.[/red][/bold]"
         )
+    finally:
+        # a background sync belongs to this run,
+        # at interpreter exit it could not submit requests any more
+        wait_for_sync()
+        if metrics.cache_summary():
+            logger.info(f"cache hits/misses: {metrics.cache_summary()}")
+        if args.metrics:
+            filename = metrics.write_textfile(args.metrics, args.command[0],
+                                              Path(args.configfile).stem,
+                                              time.perf_counter() - start, success)
+            logger.info(f"metrics written to {filename}")
 
 if __name__ == "__main__":
     main()
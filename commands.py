@@ -8,23 +8,34 @@
 # pylint: disable=no-member
 # pylint: disable=redefined-builtin
 
+from io import BytesIO
 from pathlib import Path
 import argparse
 import logging
 import locale
+import threading
+import time
 
 import datetime as dt
 from typing import Dict, Callable
 from typing_extensions import TypedDict
 
+import pandas as pd
 from dateutil.parser import parse as dateparse
 from PyPDF2 import PdfReader, PdfWriter
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, NameObject
 from rich import print
+from rich.table import Table
 
-from graph import weight_graph, calorie_graph, year_nutrients_heatmap, year_stats_heatmap
-from report import pdf_report, html_report
+from graph import weight_graph, weight_data, calorie_graph, calorie_data, year_nutrients_heatmap, year_stats_heatmap, chart_files
+from report import pdf_report, html_report, html_pages, table_data
+from foods import update_foods, load_diary
+from search import update_search_index, search as search_index
+from stats import update_rolling, query_rolling, update_rollup, rollup_periods
 
-from mfp import MFPReport
+from metrics import timed, stage, count
+from mfp import MFPReport, write_if_changed
+from progress import Progress
 mfp = MFPReport()
 
 class CommandDefinition(TypedDict):
@@ -85,16 +96,49 @@ def check_and_rename(file_path: Path, file_name: str, file_ext: str=None, unique
     raise ValueError("Checked 100 times, could not find a unique filename")
 
 
+def scale_page(page, width: float, height: float) -> None:
+    """ page.scale_to without parsing the content stream
+
+        the scale is wrapped around the content as it is, PyPDF2 parses every
+        operator of a chart with thousands of points, seconds per page """
+    if ('/Annots' in page and len(page['/Annots'].get_object()) > 0) or '/VP' in page:
+        # links move with the page, leave those to PyPDF2
+        page.scale_to(width, height)
+        page.compress_content_streams()
+        return
+    scale_x = width / float(page.mediabox.width)
+    scale_y = height / float(page.mediabox.height)
+    contents = page['/Contents'].get_object()
+    parts = contents if isinstance(contents, ArrayObject) else [contents]
+    stream = DecodedStreamObject()
+    stream.set_data(f"q {scale_x:.6f} 0 0 {scale_y:.6f} 0 0 cm\n".encode('ascii')
+                    + b"\n".join(x.get_object().get_data() for x in parts) + b"\nQ")
+    page[NameObject('/Contents')] = stream.flate_encode()
+    page.cropbox = page.cropbox.scale(scale_x, scale_y)
+    page.artbox = page.artbox.scale(scale_x, scale_y)
+    page.bleedbox = page.bleedbox.scale(scale_x, scale_y)
+    page.trimbox = page.trimbox.scale(scale_x, scale_y)
+    page.mediabox = page.mediabox.scale(scale_x, scale_y)
+
+@timed('pdf_assembly')
 def add_page(writer, buffer):
     """ resize a pdf page and add to writer """
     pdf = PdfReader(buffer)
+    count('pages_rendered', len(pdf.pages))
     for page in pdf.pages:
-        # page = pdf.pages[]
-        page.scale_to(mfp.landscape_width * 72, mfp.landscape_height * 72)
-        page.compress_content_streams()
+        scale_page(page, mfp.landscape_width * 72, mfp.landscape_height * 72)
         writer.add_page(page)
 
 
+def save_pdf(writer, filename: Path) -> None:
+    """ write the assembled pdf, a pdf with the same bytes on disk is left alone """
+    with stage('pdf_assembly'):
+        buf = BytesIO()
+        writer.write(buf)
+        written = write_if_changed(filename, buf.getvalue())
+    print("Save:" if written else "Unchanged:", filename)
+
+
 @command(
     """Create a json file containing the configuration"""
 )
@@ -104,6 +148,150 @@ def config(args, *extra, **kwargs):
     print(f"Save {filename}")
 
 
+def in_locales(reports: list):
+    """ yield every report with the date locale set to its own, restored afterwards """
+    previous = locale.setlocale(locale.LC_TIME)
+    try:
+        for language in reports:
+            locale.setlocale(locale.LC_TIME, language.locale)
+            yield language
+    finally:
+        locale.setlocale(locale.LC_TIME, previous)
+
+
+def locale_reports(configfiles: list) -> list:
+    """ a text layer of mfp for every config file of --locales, or mfp itself """
+    return [mfp.text_layer(configfile) for configfile in configfiles] or [mfp]
+
+
+def locale_name(configfiles: list, number: int, name: str) -> str:
+    """ name of the output of the report for configfiles[number], the name itself without --locales """
+    return f"{name}_{Path(configfiles[number]).stem}" if configfiles else name
+
+
+def add_locales_argument(parser):
+    """ the --locales option of the commands that write a report per language """
+    parser.add_argument(
+        "--locales",
+        nargs="+",
+        default=[],
+        help="Config files whose language settings each get a report, e.g. english.json dutch.json",
+    )
+
+
+def csv_dates() -> tuple:
+    """ first and last date in the csv, from its index """
+    dates = mfp.load_index()['dates']
+    return tuple(dt.datetime.strptime(x, '%Y-%m-%d') for x in (dates[0], dates[-1]))
+
+
+def combined_pages(args, df_body, first_date, last_date) -> list:
+    """ (label, last day it shows or None, render(reports)) for every page of combined
+
+        render computes a page once and returns one pdf per report in reports, the
+        reports only differ in their text layer (MFPReport.text_layer). Every page
+        queries its data when it is rendered, a week page only reads its own days """
+    if args.date is None:
+        end_date = max([last_date, df_body.index.max()])
+    else:
+        end_date = dt.datetime( year=args.date.year,
+                                month=args.date.month,
+                                day=args.date.day )
+    year = end_date.year
+    start_date = max(first_date + dt.timedelta(3), end_date - dt.timedelta(days=365))
+    year_start = dt.datetime(year, 1, 1)
+    year_end = dt.datetime(year, 12, 31)
+
+    def weight_page(reports):
+        data = weight_data(mfp, df_body, start_date, end_date)
+        return [weight_graph(language, df_body, start_date, end_date, data) for language in in_locales(reports)]
+
+    def calorie_page(reports):
+        df_mfp = mfp.query('totals')
+        data = calorie_data(mfp, df_mfp, df_body, start_date, end_date)
+        return [calorie_graph(language, df_mfp, df_body, start_date, end_date, data) for language in in_locales(reports)]
+
+    def week_page(next_date):
+        def render(reports):
+            df_data = mfp.query('diary', next_date - dt.timedelta(days=6), next_date)
+            data = table_data(df_data, next_date - dt.timedelta(days=6), next_date)
+            return [pdf_report(language, df_data, next_date, data) for language in in_locales(reports)]
+        return render
+
+    def stats_page(reports):
+        df_year = mfp.query('totals', year_start, year_end)
+        return [year_stats_heatmap(language, df_year, year) for language in in_locales(reports)]
+
+    def nutrients_page(reports):
+        df_year = mfp.query('totals', year_start, year_end)
+        df_cube = mfp.query('rollup')
+        return [year_nutrients_heatmap(language, df_year, year, df_cube) for language in in_locales(reports)]
+
+    pages = [('weight graph', None, weight_page),
+             ('calorie graph', end_date, calorie_page)]
+    for looper in range(args.weeks):
+        next_date = last_date - dt.timedelta(days=looper * 7)
+        pages.append((f"report for {next_date}", next_date, week_page(next_date)))
+    pages.append((f"stats heatmap: {year}", year_end, stats_page))
+    pages.append((f"nutrition heatmap: {year}", year_end, nutrients_page))
+    return pages
+
+
+def combined_pipelined(args, df_body, reports: list) -> list:
+    """ fetch in a thread, meanwhile render the pages that only show days already in the csv """
+    first_date, last_date = csv_dates()
+    first_new = last_date + dt.timedelta(days=1)
+    yesterday = dt.datetime.combine(dt.date.today() - dt.timedelta(days=1), dt.time())
+    # to_csv fetches up to yesterday, so the pages are known before the fetch is done
+    pages = combined_pages(args, df_body, first_date, max(last_date, yesterday))
+
+    sync: dict = {}
+    def fetch():
+        start = time.perf_counter()
+        try:
+            sync['summary'] = mfp.sync()
+        except Exception as error:      # pylint: disable=broad-except
+            sync['error'] = error
+        sync['seconds'] = time.perf_counter() - start
+
+    print("Getting latest data")
+    thread = threading.Thread(target=fetch, name="to_csv")
+    thread.start()
+
+    buffers: dict = {}
+    with Progress("pages", len(pages), "pages", mfp.progress_interval) as progress:
+        for looper, (label, last_day, render) in enumerate(pages):
+            if last_day is None or last_day < first_new or first_new > yesterday:
+                buffers[looper] = render(reports)
+                progress.advance(label)
+        early = len(buffers)
+
+        start = time.perf_counter()
+        thread.join()
+        waited = time.perf_counter() - start
+        if 'error' in sync:
+            raise sync['error']
+        if 'stopped' in sync['summary']:
+            print(f"Fetch stopped: {sync['summary']['stopped']}, the report ends at the last day in the csv, run again to resume")
+
+        _, csv_last = csv_dates()
+        if csv_last != max(last_date, yesterday):
+            # the fetch ended before yesterday, the pages move to the days the csv has
+            rendered = {(label, day): buffers[looper] for looper, (label, day, _) in enumerate(pages) if looper in buffers}
+            pages = combined_pages(args, df_body, first_date, csv_last)
+            buffers = {looper: rendered[(label, day)] for looper, (label, day, _) in enumerate(pages) if (label, day) in rendered}
+
+        if len(buffers) < len(pages):
+            for looper, (label, _, render) in enumerate(pages):
+                if looper not in buffers:
+                    buffers[looper] = render(reports)
+                    progress.advance(label)
+
+    print(f"Fetch took {sync['seconds']:.1f}s, {max(0, sync['seconds'] - waited):.1f}s of it hidden "
+          f"behind {early} of {len(pages)} pages rendered meanwhile")
+    return [buffers[looper] for looper in range(len(pages))]
+
+
 @command(
     """Create a combined pdf report going back (x) weeks, from (x) date
             default: week = 1, date = today
@@ -125,88 +313,121 @@ def combined(args, *extra, **kwargs):
         type=lambda datestr: dateparse(datestr).date(),
         help="The date for which to display information.",
     )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="Render the pages that do not need new days while fetching.",
+    )
+    add_locales_argument(parser)
     args = parser.parse_args(extra)
 
     print("Running combined report with", args)
 
-    print("Getting latest data")
-    mfp.to_csv()
-
-    df_data = mfp.load_df()
-    df_mfp = mfp.pivot_df(df_data)
-    df_body = mfp.load_weight_df()
-
-    if args.date is None:
-        end_date = max([df_data.index.max(), df_body.index.max()])
+    reports = locale_reports(args.locales)
+    df_body = mfp.query('weight')
+    if args.pipeline and Path(mfp.mfp_csv_file).is_file() and not mfp.sync_skip_reason() and mfp.sync_policy != 'background':
+        buffers = combined_pipelined(args, df_body, reports)
     else:
-        end_date = dt.datetime( year=args.date.year,
-                                month=args.date.month,
-                                day=args.date.day )
-    year = end_date.year
-    start_date = max(df_data.index.min() + dt.timedelta(3), end_date - dt.timedelta(days=365))
-
-    writer = PdfWriter()
-    print('Preparing weight graph')
-    add_page(writer, weight_graph(mfp, df_body, start_date, end_date))
-    print('Preparing calorie graph')
-    add_page(writer, calorie_graph(mfp, df_mfp, df_body, start_date, end_date))
-
-    end_date = df_data.index.max()
-    for looper in range(args.weeks):
-        next_date = end_date - dt.timedelta(days=looper * 7)
-        print('Preparing report for', next_date)
-        add_page(writer, pdf_report(mfp, df_data=df_data, end_date=next_date))
-
-    print(f"Preparing stats heatmap: {year}")
-    add_page(writer, year_stats_heatmap(mfp, df_mfp, year))
-    print(f"Preparing nutrition heatmap: {year}")
-    add_page(writer, year_nutrients_heatmap(mfp, df_mfp, year))
-
-    filename = check_and_rename(mfp.output_directory, "combined", "pdf", unique=False)
-    with open(filename, 'wb') as output:
-        writer.write(output)
-    print("Save:", filename)
+        print("Getting latest data")
+        mfp.sync()
+        buffers = []
+        pages = combined_pages(args, df_body, *csv_dates())
+        with Progress("pages", len(pages), "pages", mfp.progress_interval) as progress:
+            for label, _, render in pages:
+                buffers.append(render(reports))
+                progress.advance(label)
+
+    for number in range(len(reports)):
+        writer = PdfWriter()
+        for page in buffers:
+            add_page(writer, page[number])
+
+        name = locale_name(args.locales, number, "combined")
+        filename = check_and_rename(mfp.output_directory, name, "pdf", unique=False)
+        save_pdf(writer, filename)
+
+def year_range(text: str) -> range:
+    """ '2021' or '2019-2024' as a range of years """
+    first, _, last = text.partition('-')
+    return range(int(first), int(last or first) + 1)
 
 @command(
     """Create a yearly report showing all data for year (x)
-          default: year = curren
+          default: year = current, a range like 2019-2024 or --all for every year in the csv,
+          one pdf per year or --archive for a single pdf
           e.g. yearly 2021"""
 )
 def yearly(args, *extra, **kwargs):
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "year",
+        "years",
         nargs="?",
-        default=dt.date.today().year,
-        type=int,
-        help="The year of the report"
+        default=year_range(str(dt.date.today().year)),
+        type=year_range,
+        help="The year of the report, or a range of years"
     )
+    parser.add_argument("--all", action="store_true", help="Every year in the csv")
+    parser.add_argument("--archive", action="store_true", help="All years in one pdf")
+    add_locales_argument(parser)
     args = parser.parse_args(extra)
 
     print("Running yearly report with", args)
 
-    df_data = mfp.load_df()
-    df_mfp = mfp.pivot_df(df_data)
-    df_body = mfp.load_weight_df()
-
-    start_date = dt.datetime( year=args.year, month=1, day=1 )
-    end_date = dt.datetime( year=args.year, month=12, day=31 )
-
-    writer = PdfWriter()
-    print('Preparing weight graph')
-    add_page(writer, weight_graph(mfp, df_body, start_date, end_date))
-    print('Preparing calorie graph')
-    add_page(writer, calorie_graph(mfp, df_mfp, df_body, start_date, end_date))
-
-    print(f"Preparing stats heatmap: {args.year}")
-    add_page(writer, year_stats_heatmap(mfp, df_mfp, args.year))
-    print(f"Preparing nutrition heatmap: {args.year}")
-    add_page(writer, year_nutrients_heatmap(mfp, df_mfp, args.year))
-
-    filename = check_and_rename(mfp.output_directory, f"year_{args.year}", "pdf", unique=False)
-    with open(filename, 'wb') as output:
-        writer.write(output)
-    print("Save:", filename)
+    # load and pivot once, every year renders from its own slice
+    df_mfp = mfp.query('totals')
+    df_body = mfp.query('weight')
+    df_cube = mfp.query('rollup')
+    df_years = dict(tuple(df_mfp.groupby(df_mfp.index.year)))
+    body_years = set(df_body.index.year)
+
+    years = sorted(df_years) if args.all else list(args.years)
+    for year in years:
+        if year not in df_years:
+            print(f"No data for {year}")
+        elif year not in body_years:
+            print(f"No weight data for {year}, skipping the weight and calorie graph")
+    years = [year for year in years if year in df_years]
+    reports = locale_reports(args.locales)
+    writers = [PdfWriter() for _ in reports]
+    rendered = []
+
+    def save(name):
+        for number, writer in enumerate(writers):
+            filename = check_and_rename(mfp.output_directory, locale_name(args.locales, number, name), "pdf",
+                                        unique=False)
+            save_pdf(writer, filename)
+
+    pages = sum(4 if year in body_years else 2 for year in years)
+    with Progress("pages", pages, "pages", mfp.progress_interval) as progress:
+        for year in years:
+            start_date = dt.datetime( year=year, month=1, day=1 )
+            end_date = dt.datetime( year=year, month=12, day=31 )
+
+            # the data of a graph is computed once, every language only draws it
+            if year in body_years:
+                data = weight_data(mfp, df_body, start_date, end_date)
+                for writer, language in zip(writers, in_locales(reports)):
+                    add_page(writer, weight_graph(language, df_body, start_date, end_date, data))
+                progress.advance(f"weight graph: {year}")
+                data = calorie_data(mfp, df_mfp, df_body, start_date, end_date)
+                for writer, language in zip(writers, in_locales(reports)):
+                    add_page(writer, calorie_graph(language, df_mfp, df_body, start_date, end_date, data))
+                progress.advance(f"calorie graph: {year}")
+
+            for writer, language in zip(writers, in_locales(reports)):
+                add_page(writer, year_stats_heatmap(language, df_years[year], year))
+            progress.advance(f"stats heatmap: {year}")
+            for writer, language in zip(writers, in_locales(reports)):
+                add_page(writer, year_nutrients_heatmap(language, df_years[year], year, df_cube))
+            progress.advance(f"nutrition heatmap: {year}")
+            rendered.append(year)
+
+            if not args.archive:
+                save(f"year_{year}")
+                writers = [PdfWriter() for _ in reports]
+
+    if args.archive and rendered:
+        save(f"year_{rendered[0]}" if len(rendered) == 1 else f"year_{rendered[0]}-{rendered[-1]}")
 
 @command(
     """Create a food pdf report going back (x) weeks, from (x) date
@@ -229,6 +450,7 @@ def report(args, *extra, **kwargs):
         type=lambda datestr: dateparse(datestr).date(),
         help="The date for which to display information.",
     )
+    add_locales_argument(parser)
     args = parser.parse_args(extra)
 
     print("Running food report with", args)
@@ -237,28 +459,30 @@ def report(args, *extra, **kwargs):
         return
 
     print("Getting latest data")
-    mfp.to_csv()
-
-    df_data = mfp.load_df()
+    mfp.sync()
 
     if args.date is None:
-        end_date = df_data.index.max()
-    else:
-        end_date = dt.datetime( year=args.date.year,
-                                month=args.date.month,
-                                day=args.date.day )
+        args.date = mfp.last_csv_date()
+    end_date = dt.datetime( year=args.date.year,
+                            month=args.date.month,
+                            day=args.date.day )
+    df_data = mfp.query('diary', end_date - dt.timedelta(days=args.weeks * 7 - 1), end_date)
 
-    writer = PdfWriter()
+    reports = locale_reports(args.locales)
+    writers = [PdfWriter() for _ in reports]
 
-    for looper in range(args.weeks):
-        next_date = end_date - dt.timedelta(days=looper * 7)
-        print('Preparing report for', next_date)
-        add_page(writer, pdf_report(mfp, df_data=df_data, end_date=next_date))
+    with Progress("pages", args.weeks, "pages", mfp.progress_interval) as progress:
+        for looper in range(args.weeks):
+            next_date = end_date - dt.timedelta(days=looper * 7)
+            data = table_data(df_data, next_date - dt.timedelta(days=6), next_date)
+            for writer, language in zip(writers, in_locales(reports)):
+                add_page(writer, pdf_report(language, df_data, next_date, data))
+            progress.advance(f"report for {next_date:%Y-%m-%d}")
 
-    filename = check_and_rename(mfp.output_directory, "report", "pdf", unique=False)
-    with open(filename, 'wb') as output:
-        writer.write(output)
-    print("Save:", filename)
+    for number, writer in enumerate(writers):
+        filename = check_and_rename(mfp.output_directory, locale_name(args.locales, number, "report"), "pdf",
+                                    unique=False)
+        save_pdf(writer, filename)
 
 
 @command(
@@ -282,6 +506,23 @@ def html(args, *extra, **kwargs):
         type=lambda datestr: dateparse(datestr).date(),
         help="The date for which to display information.",
     )
+    parser.add_argument(
+        "--paged",
+        action="store_true",
+        help="Write one page per span of days and an index page.",
+    )
+    parser.add_argument(
+        "--span",
+        default=mfp.html_page_days,
+        type=int,
+        help="The number of days on a page.",
+    )
+    parser.add_argument(
+        "--charts",
+        action="store_true",
+        help="Add weight and calorie chart thumbnails that open the svg.",
+    )
+    add_locales_argument(parser)
     args = parser.parse_args(extra)
 
     print("Running html report with", args)
@@ -290,24 +531,213 @@ def html(args, *extra, **kwargs):
         return
 
     print("Getting latest data")
-    mfp.to_csv()
+    mfp.sync()
+
+    if args.date is None:
+        args.date = mfp.last_csv_date()
+    end_date = dt.datetime( year=args.date.year,
+                            month=args.date.month,
+                            day=args.date.day )
+    start_date = end_date - dt.timedelta(days=args.days)
+
+    chart_data = None
+    if args.charts:
+        df_mfp = mfp.query('totals')
+        chart_start = max(df_mfp.index.min() + dt.timedelta(3), end_date - dt.timedelta(days=365))
+        chart_data = (df_mfp, mfp.query('weight'), chart_start, end_date)
+    df_data = data = None
+    if not args.paged:
+        df_data = mfp.query('diary', start_date, end_date)
+        data = table_data(df_data, start_date, end_date)
+
+    # every language gets its own directory, with its own charts
+    for number, language in enumerate(in_locales(locale_reports(args.locales))):
+        if args.paged or args.locales:
+            directory = Path(mfp.output_directory, locale_name(args.locales, number, "html"))
+        else:
+            directory = Path(mfp.output_directory)
+
+        charts = chart_files(language, *chart_data, directory) if chart_data else None
+
+        if args.paged:
+            result = html_pages(language, start_date, end_date, directory, args.span, charts)
+            print(f"Pages written {result['written']}, unchanged {result['skipped']}")
+            print("Save:", Path(directory, "index.html"))
+            continue
+
+        xml_string = html_report(language, df_data, start_date, end_date, charts, data)
+        filename = check_and_rename(directory, "report", "html", unique=False)
+
+        with open(filename, 'w', encoding=locale.getpreferredencoding()) as output:
+            output.write(xml_string)
+        count('output_bytes', Path(filename).stat().st_size)
+        print("Save:", filename)
+
+@command(
+    """Show rolling averages for the configured windows on (x) date
+        default: date = last day in csv
+        e.g. stats 2021-12-31"""
+)
+def stats(args, *extra, **kwargs):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "date",
+        nargs="?",
+        default=None,
+        type=lambda datestr: dateparse(datestr).date(),
+        help="The date for which to display information.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recalculate all rolling statistics.",
+    )
+    args = parser.parse_args(extra)
 
-    df_data = mfp.load_df()
+    df_mfp = mfp.query('totals')
+    df_body = mfp.query('weight')
+    df_roll = update_rolling(mfp, df_mfp, df_body, rebuild=args.rebuild)
 
     if args.date is None:
-        end_date = df_data.index.max()
+        end_date = df_roll.index.max()
     else:
         end_date = dt.datetime( year=args.date.year,
                                 month=args.date.month,
                                 day=args.date.day )
-    start_date = end_date - dt.timedelta(days=args.days)
+    df_day = query_rolling(df_roll, end_date, end_date)
+    if len(df_day) == 0:
+        print(f"No statistics for {end_date:%Y-%m-%d}")
+        return
+
+    table = Table(title=f"{mfp.tr('rolling averages')} {end_date:%A %-d %b %Y}")
+    table.add_column(mfp.tr('category'))
+    for window in mfp.rolling_windows:
+        table.add_column(f"{window} {mfp.tr('days')}", justify="right")
+    for metric in mfp.rolling_metrics:
+        values = [df_day[f"{metric}_ma{window}"].iloc[0] for window in mfp.rolling_windows]
+        table.add_row(mfp.tr(metric), *["-" if pd.isna(value) else f"{value:.1f}" for value in values])
+    print(table)
 
-    xml_string = html_report(mfp, df_data=df_data, start_date=start_date, end_date=end_date)
-    filename = check_and_rename(mfp.output_directory, "report", "html", unique=False)
+@command(
+    """Show daily averages for the last (x) periods of day, week, month or year
+        default: period = week, count = 8
+        e.g. summary month 12"""
+)
+def summary(args, *extra, **kwargs):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "period",
+        nargs="?",
+        default="week",
+        choices=["day", "week", "month", "year"],
+        help="The granularity of the summary.",
+    )
+    parser.add_argument(
+        "count",
+        nargs="?",
+        default=8,
+        type=int,
+        help="The number of periods to show.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Recalculate the whole rollup.",
+    )
+    args = parser.parse_args(extra)
+
+    if args.rebuild:
+        df_cube = update_rollup(mfp, mfp.query('totals'), rebuild=True)
+    else:
+        df_cube = mfp.query('rollup')
+    df_mean = rollup_periods(df_cube, args.period).tail(args.count)
+    df_days = rollup_periods(df_cube, args.period, stat='count').tail(args.count)
+
+    table = Table(title=f"{mfp.tr('daily average per')} {mfp.tr(args.period)}")
+    table.add_column(mfp.tr(args.period))
+    table.add_column(mfp.tr('days'), justify="right")
+    categories = [x for x in mfp.summary_categories if x in df_mean]
+    for category in categories:
+        table.add_column(mfp.tr(category), justify="right")
+    for period, row in df_mean.iterrows():
+        table.add_row(period, f"{df_days.loc[period, 'calories']:.0f}", *[f"{row[x]:.0f}" for x in categories])
+    print(table)
+
+@command(
+    """Update the normalized food dictionary, entries and totals from the csv
+        e.g. foods"""
+)
+def foods(args, *extra, **kwargs):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Normalize the whole csv again.",
+    )
+    args = parser.parse_args(extra)
+
+    if args.rebuild:
+        for filename in [mfp.foods_csv_file(), mfp.entries_csv_file(), mfp.totals_csv_file()]:
+            if Path(filename).is_file():
+                Path(filename).unlink()
+    days = update_foods(mfp)
+    print(f"Normalized {days} new days")
+
+    csv_size = Path(mfp.mfp_csv_file).stat().st_size
+    normalized_size = sum(Path(x).stat().st_size for x in [mfp.foods_csv_file(), mfp.entries_csv_file(), mfp.totals_csv_file()])
+    df_diary = load_diary(mfp)
+    print(f"{df_diary['food_id'].nunique()} distinct foods in {df_diary['food_id'].count()} entries")
+    print(f"csv {csv_size / 1024:.0f} KiB, normalized {normalized_size / 1024:.0f} KiB")
+    print(f"memory load_df {mfp.load_df().memory_usage(deep=True).sum() / 1024:.0f} KiB, "
+          f"normalized {df_diary.memory_usage(deep=False).sum() / 1024:.0f} KiB + shared strings")
+
+@command(
+    """Search the food history, totals per period for entries matching all words
+        a word ending in * matches as prefix
+        e.g. search pizza --period month --year 2021"""
+)
+def search(args, *extra, **kwargs):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "words",
+        nargs="+",
+        help="Words to search for.",
+    )
+    parser.add_argument(
+        "--period",
+        default="year",
+        choices=["day", "week", "month", "year"],
+        help="The granularity of the totals.",
+    )
+    parser.add_argument(
+        "--year",
+        default=None,
+        type=int,
+        help="Only search this year.",
+    )
+    parser.add_argument(
+        "--meal",
+        default=None,
+        help="Only search this meal.",
+    )
+    args = parser.parse_args(extra)
 
-    with open(filename, 'w', encoding=locale.getpreferredencoding()) as output:
-        output.write(xml_string)
-    print("Save:", filename)
+    index = update_search_index(mfp)
+    start_date = end_date = None
+    if args.year is not None:
+        start_date = dt.datetime( year=args.year, month=1, day=1 )
+        end_date = dt.datetime( year=args.year, month=12, day=31 )
+    df_result = search_index(index, args.words, args.period, start_date, end_date, args.meal)
+
+    table = Table(title=" ".join(args.words))
+    table.add_column(mfp.tr(args.period))
+    table.add_column(mfp.tr('entries'), justify="right")
+    table.add_column(mfp.tr('days'), justify="right")
+    table.add_column(mfp.tr('calories'), justify="right")
+    for period, row in df_result.iterrows():
+        table.add_row(period, str(row['entries']), str(row['days']), str(row['calories']))
+    table.add_row(mfp.tr('total'), str(df_result['entries'].sum()), str(df_result['days'].sum()), str(df_result['calories'].sum()), style="bold")
+    print(table)
 
 @command(
     """Extract MyFitnessPal data since (x) date into csv
@@ -337,12 +767,57 @@ def csv(args, *extra, **kwargs):
     if len(mfp.mfp_csv_file) < 1:
         raise ValueError("mfp_csv_file not specified")
     if Path(mfp.mfp_csv_file).is_file():
-        mfp.to_csv(start_date=None)
+        result = mfp.to_csv(start_date=None)
     else:
         if args.date is None:
             print("Specify a date to create csv and extract history")
             return
-        mfp.to_csv(start_date=args.date)
+        result = mfp.to_csv(start_date=args.date)
+    print(f"Session setup {result['setup_seconds']:.1f}s, fetched {result['days']} days in {result['seconds']:.1f}s "
+          f"({result['days'] / max(result['seconds'], 1e-9):.1f} days/s), {result['calls']} calls, "
+          f"{result['retries']} retries, {result['throttled']} throttled")
+    if 'stopped' in result:
+        print(f"Stopped: {result['stopped']}, run csv again to resume")
+
+    # index the appended days for search
+    update_search_index(mfp)
+
+@command(
+    """Re-fetch the last (x) days from MyFitnessPal and rewrite days that changed
+       default: days = 7, --start/--end for an explicit date range
+       e.g. resync 14"""
+)
+def resync(args, *extra, **kwargs):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "days",
+        nargs="?",
+        default=7,
+        type=int,
+        help="The number of days to go back.",
+    )
+    parser.add_argument(
+        "--start",
+        default=None,
+        type=lambda datestr: dateparse(datestr).date(),
+        help="First date to re-fetch.",
+    )
+    parser.add_argument(
+        "--end",
+        default=None,
+        type=lambda datestr: dateparse(datestr).date(),
+        help="Last date to re-fetch, at most yesterday.",
+    )
+    args = parser.parse_args(extra)
+
+    print("Running resync using", args)
+
+    if not Path(mfp.mfp_csv_file).is_file():
+        print("Nothing to resync, use csv to create the file")
+        return
+
+    result = mfp.resync(days=args.days, start_date=args.start, end_date=args.end)
+    print(f"Checked {result['checked']} days, changed {result['changed']}, rewritten {result['rewritten']}")
 
 # @command(
 #     "Format data for a given date.",
@@ -0,0 +1,51 @@
+""" diaries in plain, gzip and zstd csv files for the tests """
+# pylint: disable=redefined-outer-name
+
+import datetime as dt
+
+import pytest
+
+import csvio
+from benchmark import directory_report
+from synthetic import FakeClient, write_diary
+
+SUFFIXES = ['', '.gz', '.zst']
+DAYS = 30
+
+
+def client() -> FakeClient:
+    """ serves the same days as write_diary """
+    return FakeClient(latency=0, jitter=0)
+
+def report(directory, suffix: str):
+    """ MFPReport with the csv in directory, compressed by suffix, fetching without pacing """
+    mfp = directory_report(directory)
+    mfp.mfp_csv_file += suffix
+    mfp.fetch_rate = mfp.fetch_rate_max = 1000
+    return mfp
+
+def content(mfp) -> bytes:
+    """ the uncompressed csv """
+    with csvio.open_csv(mfp.mfp_csv_file, mfp.csv_compression) as file:
+        return file.read()
+
+@pytest.fixture
+def small_members(monkeypatch):
+    """ members of a few days, so appends and ranged reads cross member boundaries """
+    monkeypatch.setattr(csvio, 'MEMBER_SIZE', 4096)
+
+@pytest.fixture(params=SUFFIXES)
+def appended(request, tmp_path, small_members):     # pylint: disable=unused-argument
+    """ a diary written up to DAYS // 2 days ago and appended by to_csv,
+        and the same diary written at once """
+    start_date = dt.date.today() - dt.timedelta(days=DAYS)
+    expected = report(tmp_path / 'expected', '')
+    (tmp_path / 'expected').mkdir()
+    write_diary(expected, start_date, DAYS)
+
+    (tmp_path / 'csv').mkdir()
+    mfp = report(tmp_path / 'csv', request.param)
+    write_diary(mfp, start_date, DAYS // 2)
+    result = mfp.to_csv(client=client())
+    assert result['days'] == DAYS - DAYS // 2
+    return mfp, expected
@@ -0,0 +1,248 @@
+""" plain, gzip and zstd compressed csv files, read and appended by uncompressed byte offset
+
+    compressed files are a series of independent gzip members or zstd frames of about
+    MEMBER_SIZE uncompressed bytes each, followed by a short member per day appended since.
+    The index keeps [raw offset, uncompressed offset] of every member, a ranged read
+    decompresses from the member before the range only """
+# pylint: disable=line-too-long
+# pylint: disable=logging-fstring-interpolation
+
+import bisect
+import gzip
+import io
+import logging
+import os
+import zlib
+
+try:
+    import zstandard
+except ImportError:     # only needed for .zst files
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = {'.gz': 'gzip', '.zst': 'zstd'}
+# uncompressed bytes per member, larger compresses better, smaller reads less before a range
+MEMBER_SIZE = 256 * 1024
+# compressed bytes read at a time
+READ_SIZE = 64 * 1024
+
+
+class Truncated(Exception):
+    """ the file ended inside a member, the member was cut off """
+
+# what reading a damaged or replaced compressed file raises
+ERRORS: tuple = (Truncated, zlib.error) + ((zstandard.ZstdError,) if zstandard is not None else ())
+
+def codec(filename: str, compression: str='') -> str:
+    """ 'gzip', 'zstd' or '' for a plain file, compression overrides the extension """
+    name = compression or CODECS.get(os.path.splitext(filename)[1], '')
+    if name not in ('', 'gzip', 'zstd'):
+        raise ValueError(f"unknown csv compression '{name}', use 'gzip' or 'zstd'")
+    if name == 'zstd' and zstandard is None:
+        raise ImportError(f"{filename}: zstd compressed csv files need the zstandard package")
+    return name
+
+def compress(name: str, data: bytes) -> bytes:
+    """ data as one complete member """
+    if name == 'gzip':
+        return gzip.compress(data, mtime=0)
+    if name == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+def decompressor(name: str):
+    """ decompressobj for one member, with .eof and .unused_data """
+    if name == 'gzip':
+        return zlib.decompressobj(wbits=31)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+def members(raw, name: str):
+    """ yield (raw offset, b'') at the start of every member and (None, data) for its content
+
+        reads from the current position of raw, raises Truncated with the
+        offset of a member the file ends in """
+    offset = raw.tell()
+    start = None
+    current = None
+    for chunk in iter(lambda: raw.read(READ_SIZE), b''):
+        while chunk:
+            if current is None:
+                current, start = decompressor(name), offset
+                yield start, b''
+            data = current.decompress(chunk)
+            if data:
+                yield None, data
+            if current.eof:
+                offset += len(chunk) - len(current.unused_data)
+                chunk = current.unused_data
+                current = None
+            else:
+                offset += len(chunk)
+                chunk = b''
+    if current is not None:
+        raise Truncated(start)
+
+def open_csv(filename: str, compression: str=''):
+    """ binary file object of the uncompressed content, for reading it from the start """
+    name = codec(filename, compression)
+    if name == 'gzip':
+        return gzip.open(filename, 'rb')
+    if name == 'zstd':
+        reader = zstandard.ZstdDecompressor().stream_reader(open(filename, 'rb'), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader)
+    return open(filename, 'rb')
+
+def read_range(filename: str, index: dict, begin: int, end: int, compression: str='') -> bytes:
+    """ the uncompressed bytes begin..end, index['members'] says where to start decompressing """
+    name = codec(filename, compression)
+    with open(filename, 'rb') as raw:
+        if not name:
+            raw.seek(begin)
+            return raw.read(max(0, end - begin))
+        starts = index.get('members') or [[0, 0]]
+        start = starts[max(0, bisect.bisect_right([x[1] for x in starts], begin) - 1)]
+        raw.seek(start[0])
+        position = start[1]
+        parts = []
+        for _, data in members(raw, name):
+            if position + len(data) > begin:
+                parts.append(data[max(0, begin - position):max(0, end - position)])
+            position += len(data)
+            if position >= end:
+                break
+        return b''.join(parts)
+
+def lines(filename: str, start: int, position: int, found: list, compression: str=''):
+    """ yield (uncompressed offset, line) from raw offset start, which is uncompressed offset position
+
+        for a compressed file [raw offset, uncompressed offset] of every member is added to found.
+        A member cut short by an interrupted write is removed from the file and Truncated
+        is raised, its days are fetched again by the next to_csv """
+    name = codec(filename, compression)
+    with open(filename, 'rb') as raw:
+        raw.seek(start)
+        if not name:
+            for line in iter(raw.readline, b''):
+                yield position, line
+                position += len(line)
+            return
+
+        rest = b''
+        try:
+            for offset, data in members(raw, name):
+                if offset is not None:
+                    found.append([offset, position + len(rest)])
+                    continue
+                data = rest + data
+                begin = 0
+                newline = data.find(b'\n')
+                while newline >= 0:
+                    yield position, data[begin:newline + 1]
+                    position += newline + 1 - begin
+                    begin = newline + 1
+                    newline = data.find(b'\n', begin)
+                rest = data[begin:]
+        except Truncated as error:
+            logger.warning(f"{filename} ends inside the member at {error.args[0]}, removing it")
+            os.truncate(filename, error.args[0])
+            raise
+        if rest:
+            yield position, rest
+
+
+class Appender:
+    """ append whole days at the end of the data and keep index up to date
+
+        every add is written and flushed at once, so an interrupted run keeps the days it
+        added. A compressed file gets a member per add. Once the short members at its end
+        hold MEMBER_SIZE bytes they are joined into one member in a copy of the file that
+        then replaces it, the file never holds a day twice or lost. Hold CSV_LOCK while adding """
+
+    def __init__(self, filename: str, index: dict, compression: str=''):
+        self.filename = filename
+        self.index = index
+        self.name = codec(filename, compression)
+        self.index.setdefault('end', 0)
+        self.index.setdefault('members', [])
+        self.file = open(filename, 'ab')
+        # the members from here on are short, left by earlier runs or added since the last join
+        found = self.index['members']
+        bounds = [x[1] for x in found] + [self.index['end']]
+        self.first = len(found)
+        while self.first > 0 and bounds[self.first] - bounds[self.first - 1] < MEMBER_SIZE:
+            self.first -= 1
+
+    def add(self, date: str, data: bytes) -> None:
+        """ append the bytes of a day, date None for bytes that are not a day like the header """
+        if date is not None:
+            self.index['dates'].append(date)
+            self.index['offsets'].append(self.index['end'])
+        position = self.index['end']
+        self.index['end'] += len(data)
+        if not self.name:
+            self.file.write(data)
+            self.file.flush()
+            return
+        start = self.file.seek(0, os.SEEK_END)
+        self.file.write(compress(self.name, data))
+        self.file.flush()
+        self.index['members'].append([start, position])
+        if self.index['end'] - self.index['members'][self.first][1] >= MEMBER_SIZE:
+            self.join()
+
+    def join(self) -> None:
+        """ replace the short members at the end by one member """
+        found = self.index['members']
+        start = found[self.first]
+        member = compress(self.name, read_range(self.filename, {'members': [start]}, start[1], self.index['end'], self.name))
+        self.file.close()
+        temporary = f"{self.filename}.tmp"
+        with open(self.filename, 'rb') as source, open(temporary, 'wb') as target:
+            left = start[0]
+            while left > 0:
+                chunk = source.read(min(left, READ_SIZE))
+                if not chunk:
+                    raise Truncated(start[0])
+                target.write(chunk)
+                left -= len(chunk)
+            target.write(member)
+            target.flush()
+            os.fsync(target.fileno())
+        os.replace(temporary, self.filename)
+        del found[self.first:]
+        found.append(start)
+        self.first = len(found)
+        self.file = open(self.filename, 'ab')
+
+    def close(self) -> None:
+        """ close the file, everything added is written already """
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def cut_point(filename: str, index: dict, position: int, compression: str='') -> int:
+    """ where truncate can cut the data off to end before position, a compressed
+        file only at the start of a member so the caller appends the rest again """
+    if not codec(filename, compression):
+        return position
+    starts = [x[1] for x in index.get('members', []) if x[1] <= position]
+    return starts[-1] if starts else 0
+
+def truncate(filename: str, index: dict, position: int, compression: str='') -> None:
+    """ cut the data and the index off at uncompressed position, a cut_point """
+    found = index.setdefault('members', [])
+    raw_end = position
+    if codec(filename, compression):
+        keep = bisect.bisect_left([x[1] for x in found], position)
+        raw_end = found[keep][0] if keep < len(found) else (os.path.getsize(filename) if found else 0)
+        del found[keep:]
+    first = bisect.bisect_left(index['offsets'], position)
+    del index['dates'][first:]
+    del index['offsets'][first:]
+    index['end'] = position
+    os.truncate(filename, raw_end)
@@ -0,0 +1,112 @@
+""" pivoted daily totals as a memory-mapped day x category array """
+# pylint: disable=line-too-long
+# pylint: disable=logging-fstring-interpolation
+
+import json
+import logging
+import os
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from mfp import MFPReport, DERIVED_TOTALS
+
+logger = logging.getLogger(__name__)
+
+
+class DenseTotals:
+    """ row n is the day first_day + n, one column per pivot category, NaN when not logged
+
+        the values are a read-only memory map of mfp.dense_file(),
+        DERIVED_TOTALS are not stored but added by frame() """
+
+    def __init__(self, mfp: MFPReport):
+        self.mfp = mfp
+        with open(f"{mfp.dense_file()}.json", encoding='utf-8') as file:
+            meta = json.load(file)
+        self.first_day = pd.Timestamp(meta['first_day'])
+        self.columns: list = meta['columns']
+        rows = os.path.getsize(mfp.dense_file()) // (8 * len(self.columns))
+        if rows > 0:
+            self.values = np.memmap(mfp.dense_file(), dtype='<f8', mode='r', shape=(rows, len(self.columns)))
+        else:
+            self.values = np.empty((0, len(self.columns)))
+
+    @property
+    def last_day(self) -> pd.Timestamp:
+        """ the date of the last row """
+        return self.first_day + pd.Timedelta(days=len(self.values) - 1)
+
+    def row(self, date) -> int:
+        """ row number of a date """
+        return (pd.Timestamp(date) - self.first_day).days
+
+    def rows(self, start_date=None, end_date=None) -> slice:
+        """ rows of a date range, clipped to the stored days """
+        start = 0 if start_date is None else min(max(self.row(start_date), 0), len(self.values))
+        end = len(self.values) if end_date is None else min(max(self.row(end_date) + 1, start), len(self.values))
+        return slice(start, end)
+
+    def frame(self, start_date=None, end_date=None) -> DataFrame:
+        """ the same frame as MFPReport.pivot_df for a date range, days without data are left out """
+        rows = self.rows(start_date, end_date)
+        index = pd.date_range(self.first_day + pd.Timedelta(days=rows.start), periods=rows.stop - rows.start, name='date')
+        df_mfp = pd.DataFrame(self.values[rows], index=index, columns=pd.Index(self.columns, name='category'))
+        df_mfp = df_mfp.drop(columns=DERIVED_TOTALS, errors='ignore').dropna(how='all')
+        df_mfp = pd.concat([df_mfp, self.mfp.derive_totals(df_mfp)], axis=1).sort_index(axis=1)
+        df_mfp.columns.name = 'category'
+        return df_mfp
+
+def write_meta(mfp: MFPReport, first_day, columns: list) -> None:
+    """ first day and column order of the dense file """
+    with open(f"{mfp.dense_file()}.json", 'w', encoding='utf-8') as file:
+        json.dump({'first_day': f"{first_day:%Y-%m-%d}", 'columns': columns}, file)
+
+def update_dense(mfp: MFPReport) -> DenseTotals:
+    """ append a row per day after the last stored day, a new category rewrites the file once
+
+        the new days are read in the chunks of mfp.memory_budget """
+
+    try:
+        dense = DenseTotals(mfp)
+        start_date = dense.last_day + dt.timedelta(days=1)
+    except FileNotFoundError:
+        dense, start_date = None, None
+    for df_data in mfp.iter_df(start_date, None):
+        dense = append_dense(mfp, dense, mfp.pivot_df(df_data))
+    return dense
+
+def append_dense(mfp: MFPReport, dense: DenseTotals, df_new: DataFrame) -> DenseTotals:
+    """ add the days of a pivot_df frame that follow the stored days """
+
+    df_new = df_new.drop(columns=DERIVED_TOTALS, errors='ignore')
+    if len(df_new) == 0:
+        return dense
+
+    empty = dense is None or len(dense.values) == 0
+    first_day, columns = (df_new.index.min(), []) if empty else (dense.first_day, dense.columns)
+
+    new_columns = sorted(x for x in df_new.columns if x not in columns)
+    if empty or len(new_columns) > 0:
+        # (re)write the whole file with the extra columns, only then the stored days are read
+        df_old = None if empty else dense.frame()
+        columns = columns + new_columns
+        df_all = pd.concat([df_old, df_new]) if df_old is not None else df_new
+        df_all = df_all.reindex(index=pd.date_range(first_day, df_all.index.max()), columns=columns)
+        data = np.ascontiguousarray(df_all.values, dtype='<f8').tobytes()
+        del dense, df_old
+        with open(mfp.dense_file(), 'wb') as file:
+            file.write(data)
+        write_meta(mfp, first_day, columns)
+        logger.info(f"dense totals: wrote {len(df_all)} days x {len(columns)} categories")
+        return DenseTotals(mfp)
+
+    df_new = df_new.reindex(index=pd.date_range(dense.last_day + dt.timedelta(days=1), df_new.index.max()), columns=columns)
+    with open(mfp.dense_file(), 'r+b') as file:
+        file.truncate(len(dense.values) * 8 * len(columns))    # drop a partially written row
+        file.seek(0, os.SEEK_END)
+        file.write(np.ascontiguousarray(df_new.values, dtype='<f8').tobytes())
+    logger.info(f"dense totals: appended {len(df_new)} days")
+    return DenseTotals(mfp)
@@ -0,0 +1,241 @@
+""" myfitnesspal sessions and paced, retried and parallel day requests for to_csv and resync """
+# pylint: disable=line-too-long
+# pylint: disable=too-many-instance-attributes
+# pylint: disable=logging-fstring-interpolation
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import LWPCookieJar, LoadError
+from typing import Dict, Tuple
+
+import myfitnesspal
+
+from metrics import count, stage
+
+try:
+    from requests.adapters import HTTPAdapter
+    from requests.exceptions import ConnectionError as RequestsConnectionError, Timeout
+    NETWORK_ERRORS: tuple = (ConnectionError, TimeoutError, RequestsConnectionError, Timeout)
+except ImportError:     # requests comes with myfitnesspal
+    HTTPAdapter = None
+    NETWORK_ERRORS = (ConnectionError, TimeoutError)
+
+logger = logging.getLogger(__name__)
+
+# answers worth asking again, 429 also slows the fetch down
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+RATE_MIN = 0.2          # requests per second
+RATE_STEP = 0.25        # requests per second added per quick success after a 429
+RATE_GROWTH = 1.25      # rate multiplier per quick success before the first 429
+
+# per session file the client opened by this process, later fetches skip the setup
+CLIENTS: Dict[str, object] = {}
+
+
+class CircuitOpen(Exception):
+    """ too many requests failed in a row, the fetch stops """
+
+def status_code(error: Exception) -> int:
+    """ http status of a failed request, 0 when there is none """
+    return getattr(getattr(error, 'response', None), 'status_code', 0) or 0
+
+def retry_after(error: Exception) -> float:
+    """ seconds from the Retry-After header, 0 when missing or a date """
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return max(0.0, float(headers.get('Retry-After', 0)))
+    except ValueError:
+        return 0.0
+
+def transient(error: Exception) -> bool:
+    """ errors that stop a fetch cleanly instead of raising, the next run resumes """
+    return isinstance(error, (CircuitOpen,) + NETWORK_ERRORS) or status_code(error) in TRANSIENT_STATUS
+
+def open_client(mfp) -> Tuple[object, bool]:
+    """ myfitnesspal.Client for mfp, returns the client and whether a new session was set up
+
+        reuses the client of an earlier fetch in this process, else the cookies saved by an
+        earlier run when younger than session_max_age. A session that no longer authenticates
+        falls back to a new one. The connection pool holds a connection per fetch thread """
+
+    filename = mfp.session_file()
+    if filename in CLIENTS:
+        return CLIENTS[filename], False
+
+    with stage('session_setup'):
+        client = None
+        if os.path.isfile(filename) and time.time() - os.stat(filename).st_mtime < mfp.session_max_age * 3600:
+            cookies = LWPCookieJar(filename)
+            try:
+                cookies.load(ignore_discard=True)
+                if len(cookies) > 0:
+                    client = myfitnesspal.Client(cookiejar=cookies)
+            except (LoadError, OSError):
+                logger.info(f"{filename} is not readable, starting a new session")
+            except Exception as error:      # pylint: disable=broad-except
+                logger.info(f"saved session did not authenticate ({error}), starting a new session")
+        new = client is None
+        if new:
+            client = myfitnesspal.Client()
+        session = getattr(client, 'session', None)
+        if session is not None and HTTPAdapter is not None:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, mfp.fetch_concurrency))
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+    CLIENTS[filename] = client
+    return client, new
+
+def save_session(mfp, client) -> None:
+    """ store the cookies of the client for the next run, readable by the owner only """
+    session = getattr(client, 'session', None)
+    if session is None:
+        return
+    filename = mfp.session_file()
+    cookies = LWPCookieJar(filename)
+    for cookie in session.cookies:
+        cookies.set_cookie(cookie)
+    os.close(os.open(filename, os.O_WRONLY | os.O_CREAT, 0o600))
+    cookies.save(ignore_discard=True)
+
+
+class FetchController:
+    """ fetch days from a DiaryClient in date order, with retries, pacing and a circuit breaker
+
+        every request waits for a free slot (concurrency) and its turn (rate). Quick answers
+        raise both, the rate grows by RATE_GROWTH until the first 429 and by RATE_STEP after
+        that. Slow answers lower the concurrency and a 429 halves both and pauses every
+        request for Retry-After. A request that fails is retried with full
+        jitter exponential backoff. After fetch_failures failed requests in a row the
+        circuit opens and every pending request stops """
+
+    def __init__(self, mfp, client):
+        self.client = client
+        self.retries: int = mfp.fetch_retries
+        self.backoff: float = mfp.fetch_backoff
+        self.backoff_max: float = mfp.fetch_backoff_max
+        self.failures_max: int = mfp.fetch_failures
+        self.rate: float = mfp.fetch_rate
+        self.rate_max: float = max(mfp.fetch_rate, mfp.fetch_rate_max)
+        self.threshold: float = self.rate_max     # end of the multiplicative growth
+        self.concurrency: int = 1
+        self.concurrency_max: int = max(1, mfp.fetch_concurrency)
+
+        self.condition = threading.Condition()
+        self.stop = threading.Event()
+        self.rng = random.Random()
+        self.in_flight = 0
+        self.next_request = 0.0     # perf_counter of the next allowed request
+        self.paused_until = 0.0
+        self.fastest = 0.0          # lowest latency seen, the uncongested baseline
+        self.failures = 0           # failed requests in a row
+        self.successes = 0
+        self.error: Exception = None   # the first error that is not worth a retry
+        self.stats = {'calls': 0, 'retries': 0, 'throttled': 0, 'errors': 0}
+
+    def acquire(self) -> None:
+        """ wait for a free slot and the next request time """
+        with self.condition:
+            while self.in_flight >= self.concurrency and not self.stop.is_set():
+                self.condition.wait()
+            if self.stop.is_set():
+                raise CircuitOpen(f"{self.failures} requests failed in a row")
+            self.in_flight += 1
+            self.stats['calls'] += 1
+            start = max(time.perf_counter(), self.next_request, self.paused_until)
+            self.next_request = start + 1 / self.rate
+        self.stop.wait(max(0.0, start - time.perf_counter()))
+
+    def release(self, latency: float=None, throttled: bool=False, pause: float=0.0) -> None:
+        """ free the slot and adapt rate and concurrency to how the request went """
+        with self.condition:
+            self.in_flight -= 1
+            if latency is None:
+                self.failures += 1
+                self.stats['throttled' if throttled else 'errors'] += 1
+                if throttled:
+                    self.rate = max(RATE_MIN, self.rate / 2)
+                    self.threshold = self.rate
+                    self.concurrency = max(1, self.concurrency // 2)
+                    self.paused_until = max(self.paused_until, time.perf_counter() + pause)
+                if self.failures >= self.failures_max:
+                    self.stop.set()
+            else:
+                self.failures = 0
+                self.fastest = latency if self.fastest == 0 else min(self.fastest, latency)
+                if latency > 2 * self.fastest + 0.1:
+                    self.concurrency = max(1, self.concurrency - 1)
+                else:
+                    grown = self.rate * RATE_GROWTH if self.rate < self.threshold else self.rate + RATE_STEP
+                    self.rate = min(self.rate_max, grown)
+                    self.successes += 1
+                    if self.successes >= self.concurrency:
+                        self.successes = 0
+                        self.concurrency = min(self.concurrency_max, self.concurrency + 1)
+            self.condition.notify_all()
+
+    def get(self, date):
+        """ one day, retried with backoff, raises the last error when all retries failed """
+        for attempt in range(self.retries + 1):
+            self.acquire()
+            start = time.perf_counter()
+            try:
+                day = self.client.get_date(date)
+            except Exception as error:      # pylint: disable=broad-except
+                if not transient(error):
+                    self.release()
+                    with self.condition:
+                        self.error = self.error or error
+                    self.stop.set()
+                    raise
+                throttled = status_code(error) == 429
+                delay = max(self.rng.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt)), retry_after(error))
+                self.release(throttled=throttled, pause=delay)
+                if attempt == self.retries or self.stop.is_set():
+                    raise
+                with self.condition:
+                    self.stats['retries'] += 1
+                count('fetch_retries')
+                logger.info(f"{date}: {error}, retry {attempt + 1} of {self.retries} in {delay:.1f}s")
+                self.stop.wait(delay)
+                continue
+            self.release(latency=time.perf_counter() - start)
+            return day
+        raise AssertionError("unreachable")
+
+    def result(self, future):
+        """ the day of a finished request, stopped requests raise the error that stopped them """
+        try:
+            return future.result()
+        except CircuitOpen:
+            if self.error is not None:
+                raise self.error from None
+            raise
+
+    def days(self, dates):
+        """ yield (date, day) in the order of dates, requests run ahead in a thread pool
+
+            the first day that can not be fetched stops every other request and is raised """
+        window: deque = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency_max, thread_name_prefix="fetch") as pool:
+            try:
+                for date in dates:
+                    window.append((date, pool.submit(self.get, date)))
+                    if len(window) >= 4 * self.concurrency_max:
+                        date, future = window.popleft()
+                        yield date, self.result(future)
+                while window:
+                    date, future = window.popleft()
+                    yield date, self.result(future)
+            finally:
+                # also when the consumer stops early
+                self.stop.set()
+                with self.condition:
+                    self.condition.notify_all()
+                for _, future in window:
+                    future.cancel()
+                count('fetch_throttled', self.stats['throttled'])
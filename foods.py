@@ -0,0 +1,127 @@
+""" normalized myfitnesspal diary: a food dictionary with slim daily entries and totals """
+# pylint: disable=line-too-long
+# pylint: disable=logging-fstring-interpolation
+
+import io
+import logging
+import datetime as dt
+from typing import Tuple
+
+import pandas as pd
+from pandas import DataFrame
+
+from mfp import MFPReport
+
+logger = logging.getLogger(__name__)
+
+
+def last_date(filename: str):
+    """ date in the first column of the last line of a csv, None when the file is missing or empty """
+    try:
+        with open(filename, 'rb') as file:
+            file.seek(0, io.SEEK_END)
+            file.seek(max(0, file.tell() - 4096))
+            last_line = file.read().rstrip().splitlines()[-1]
+        return dt.datetime.strptime(last_line[:10].decode('ascii'), '%Y-%m-%d')
+    except (FileNotFoundError, IndexError, UnicodeDecodeError, ValueError):
+        return None
+
+def normalize_df(df_data: DataFrame, df_foods: DataFrame) -> Tuple[DataFrame, DataFrame, DataFrame]:
+    """ split the csv rows into new foods, entries and totals
+
+        a food is the combination of description and details, ids continue after df_foods """
+
+    is_total = df_data.type.str.startswith('total-')
+
+    df_totals = df_data[is_total][['type', 'calories']].rename({'type': 'category', 'calories': 'value'}, axis=1)
+    df_totals['category'] = df_totals['category'].str.replace("total-", "", regex=False)
+
+    df_rows = df_data[~is_total]
+    keys = df_rows['description'].fillna('') + '\x1f' + df_rows['details'].fillna('')
+    known = pd.Series(df_foods.index, index=df_foods['description'].fillna('') + '\x1f' + df_foods['details'].fillna(''))
+    new_keys = keys[~keys.isin(known.index)].unique()
+
+    next_id = df_foods.index.max() + 1 if len(df_foods) > 0 else 0
+    df_new = pd.DataFrame({'description': [x.split('\x1f', 1)[0] for x in new_keys],
+                           'details': [x.split('\x1f', 1)[1] for x in new_keys]},
+                          index=pd.RangeIndex(next_id, next_id + len(new_keys), name='food_id'))
+    known = pd.concat([known, pd.Series(df_new.index, index=new_keys)])
+
+    df_entries = pd.DataFrame({'meal': df_rows['type'],
+                               'food_id': keys.map(known).values,
+                               'calories': df_rows['calories']}, index=df_rows.index)
+    return df_new, df_entries, df_totals
+
+def load_foods(mfp: MFPReport) -> DataFrame:
+    """ the food dictionary indexed by food_id """
+    try:
+        return pd.read_csv(mfp.foods_csv_file(), index_col='food_id', dtype={'description': str, 'details': str})
+    except FileNotFoundError:
+        return pd.DataFrame({'description': pd.Series(dtype=object), 'details': pd.Series(dtype=object)},
+                            index=pd.Index([], name='food_id', dtype='int64'))
+
+def update_foods(mfp: MFPReport) -> int:
+    """ add the days after the last normalized day, returns the number of new days
+
+        the new days are read in the chunks of mfp.memory_budget """
+
+    last = last_date(mfp.totals_csv_file())
+    header = last is None
+    df_foods = load_foods(mfp)
+    days = 0
+    foods = 0
+    for df_data in mfp.iter_df(None if header else last + dt.timedelta(days=1), None):
+        if len(df_data) == 0:
+            continue
+        df_new, df_entries, df_totals = normalize_df(df_data, df_foods)
+        df_new.to_csv(mfp.foods_csv_file(), mode='w' if header else 'a', header=header)
+        df_entries.to_csv(mfp.entries_csv_file(), mode='w' if header else 'a', header=header, date_format='%Y-%m-%d')
+        df_totals.to_csv(mfp.totals_csv_file(), mode='w' if header else 'a', header=header, date_format='%Y-%m-%d')
+        df_foods = pd.concat([df_foods, df_new])
+        header = False
+        days += df_totals.index.nunique()
+        foods += len(df_new)
+    if days > 0:
+        logger.info(f"normalized {days} days, {foods} new foods")
+    return days
+
+def load_entries(mfp: MFPReport, start_date=None, end_date=None) -> DataFrame:
+    """ slim daily rows (meal, food_id, calories) indexed by date """
+    df_entries = pd.read_csv(mfp.entries_csv_file(), index_col='date', engine='c')
+    df_entries.index = pd.to_datetime(df_entries.index, format='%Y-%m-%d')
+    return df_entries[between(df_entries, start_date, end_date)]
+
+def load_totals(mfp: MFPReport, start_date=None, end_date=None) -> DataFrame:
+    """ daily totals (category, value) indexed by date """
+    df_totals = pd.read_csv(mfp.totals_csv_file(), index_col='date', engine='c')
+    df_totals.index = pd.to_datetime(df_totals.index, format='%Y-%m-%d')
+    return df_totals[between(df_totals, start_date, end_date)]
+
+def between(df_data: DataFrame, start_date, end_date):
+    """ mask for the rows in a date range, open ended when a date is None """
+    mask = pd.Series(True, index=df_data.index)
+    if start_date is not None:
+        mask &= df_data.index >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= df_data.index <= pd.Timestamp(end_date)
+    return mask.values
+
+def load_diary(mfp: MFPReport, start_date=None, end_date=None) -> DataFrame:
+    """ same frame as MFPReport.load_df plus the food_id, joined from the normalized tables
+
+        descriptions and details are shared objects per food instead of a string per row,
+        MFPReport.query('diary') reads the diary this way """
+
+    df_foods = load_foods(mfp)
+    df_entries = load_entries(mfp, start_date, end_date)
+    df_rows = df_entries.join(df_foods, on='food_id').rename({'meal': 'type'}, axis=1)
+
+    df_totals = load_totals(mfp, start_date, end_date)
+    df_totals = pd.DataFrame({'type': 'total-' + df_totals['category'],
+                              'calories': df_totals['value']}, index=df_totals.index)
+
+    # the totals of a day follow its entries, as in the csv
+    df_data = pd.concat([df_rows, df_totals]).sort_index(kind='stable')
+    df_data.index.name = 'date'
+    df_data = mfp.derive_rows(df_data)
+    return df_data[['type', 'description', 'calories', 'details', 'food_id']]
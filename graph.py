@@ -3,10 +3,15 @@
 # pylint: disable=line-too-long
 
 from io import BytesIO
+from pathlib import Path
+from typing import Dict
 
+import hashlib
+import json
 import logging
 import datetime as dt
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import matplotlib.dates as mdates
 import matplotlib as mpl
 import calplot
@@ -18,16 +23,73 @@ from pandas import DataFrame
 from dateutil.parser import parse as dateparse
 from dateutil.relativedelta import relativedelta
 
-from mfp import MFPReport
+from mfp import MFPReport, write_if_changed
+from metrics import timed, cache_lookup
+from stats import rollup_value
 
 logger = logging.getLogger(__name__)
 
+THUMBNAIL_DPI = 30
+# savefig metadata per format, leaves out the time of saving
+DETERMINISTIC_METADATA = {'pdf': {'CreationDate': None}, 'svg': {'Date': None}}
 
-def year_stats_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> BytesIO:
-    """ plot heatmap of categories from mfp """
+# the last result of every series function, see cached_series
+SERIES_CACHE: Dict[str, tuple] = {}
+
+
+def series_key(mfp: MFPReport, *args) -> str:
+    """ hash of the numbers a series is computed from, text settings are left out """
+    digest = hashlib.sha1(mfp.config_digest().encode('ascii'))
+    for arg in args:
+        if isinstance(arg, DataFrame):
+            digest.update(json.dumps([str(x) for x in arg.columns]).encode('utf-8'))
+            digest.update(pd.util.hash_pandas_object(arg).values.tobytes())
+        else:
+            digest.update(repr(arg).encode('utf-8'))
+    return digest.hexdigest()
+
+def cached_series(function, mfp: MFPReport, *args):
+    """ function(mfp, *args) computed once for the same input, whatever format or language is drawn """
+    key = series_key(mfp, *args)
+    cached = SERIES_CACHE.get(function.__name__)
+    cache_lookup('series', cached is not None and cached[0] == key)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    result = function(mfp, *args)
+    SERIES_CACHE[function.__name__] = (key, result)
+    return result
+
+def save_figure(figure: Figure, formats: tuple=('pdf',)) -> Dict[str, BytesIO]:
+    """ one drawing saved in every format, png as a thumbnail, the figure is closed afterwards
+
+        without creation dates and with fixed svg ids, the same drawing gives the same bytes """
+    outputs = {}
+    for fmt in formats:
+        buf = BytesIO()
+        with mpl.rc_context({'svg.hashsalt': 'mfp'}):
+            figure.savefig(buf, format=fmt, bbox_inches='tight', dpi=THUMBNAIL_DPI if fmt == 'png' else 'figure',
+                           metadata=DETERMINISTIC_METADATA.get(fmt))
+        outputs[fmt] = buf
+    plt.close(figure)
+    return outputs
+
+
+def stats_data(mfp: MFPReport, df_mfp: DataFrame, year: int) -> DataFrame:
+    """ the days of year with the calorie goal column, independent of language """
 
     df_mfp = df_mfp[((df_mfp.index.year == year))].copy()
 
+    def calc_bmr(row):
+        if row["calories"] == 0:
+            return 0
+        else:
+            return row['bmr']
+    df_mfp['bmr_calc'] = df_mfp.apply(calc_bmr, axis=1)
+    return df_mfp
+
+def stats_figure(mfp: MFPReport, year: int, df_mfp: DataFrame) -> Figure:
+    """ draw the heatmap of categories from stats_data """
+
     figure, axis = plt.subplots(4, 1, figsize=(mfp.landscape_width, mfp.landscape_height))
     figure.suptitle(f"{mfp.tr('annual review')} {year} {mfp.tr('goals')}")
 
@@ -70,12 +132,6 @@ def year_stats_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> BytesIO:
                     )
     axis[2].set_title(mfp.tr('exercise'))
 
-    def calc_bmr(row):
-        if row["calories"] == 0:
-            return 0
-        else:
-            return row['bmr']
-    df_mfp['bmr_calc'] = df_mfp.apply(calc_bmr, axis=1)
     calplot.yearplot(data = df_mfp['bmr_calc'],
                      cmap = 'RdYlBu',
                      year=year,
@@ -86,16 +142,32 @@ def year_stats_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> BytesIO:
                      ax=axis[3]
                     )
     axis[3].set_title(mfp.tr('under/over daily calorie goal'))
+    return figure
 
-    buf = BytesIO()
-    figure.savefig(buf, format='pdf', bbox_inches='tight')
-    return buf
+@timed('stats_heatmap')
+def year_stats_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> BytesIO:
+    """ plot heatmap of categories from mfp """
+    return save_figure(stats_figure(mfp, year, cached_series(stats_data, mfp, df_mfp, year)))['pdf']
 
-def year_nutrients_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> BytesIO:
-    """ plot heatmap of food groups from mfp """
+def nutrients_data(mfp: MFPReport, df_mfp: DataFrame, year: int, df_cube: DataFrame=None) -> dict:
+    """ the days of year and the yearly averages of the food groups, independent of language """
 
     df_mfp = df_mfp[((df_mfp.index.year == year))].copy()
 
+    def average(category):
+        if df_cube is None:
+            return df_mfp[category].mean()
+        return rollup_value(df_cube, 'year', year, category)
+
+    return {'frame': df_mfp,
+            'averages': {category: average(category) for category in ['carbohydrates', 'protein', 'fat', 'sugar']}}
+
+def nutrients_figure(mfp: MFPReport, year: int, data: dict) -> Figure:
+    """ draw the heatmap of food groups from nutrients_data """
+
+    df_mfp = data['frame']
+    average = data['averages'].get
+
     figure, axis = plt.subplots(4,1, figsize=(mfp.landscape_width,mfp.landscape_height))
     figure.suptitle(f"{mfp.tr('annual review')} {year} {mfp.tr('nutrients')}")
 
@@ -109,7 +181,7 @@ def year_nutrients_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> Byte
                      monthlabels=mfp.monthlabels,
                      ax=axis[0]
                     )
-    axis[0].set_title(f"{mfp.tr('carbohydrates')} {mfp.tr('average')}={df_mfp['carbohydrates'].mean():.0f}g {mfp.tr('(blue/white/red)')}")
+    axis[0].set_title(f"{mfp.tr('carbohydrates')} {mfp.tr('average')}={average('carbohydrates'):.0f}g {mfp.tr('(blue/white/red)')}")
 
     calplot.yearplot(data = df_mfp['protein'],
                      cmap = 'bwr',
@@ -121,7 +193,7 @@ def year_nutrients_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> Byte
                      monthlabels=mfp.monthlabels,
                      ax=axis[1]
                     )
-    axis[1].set_title(f"{mfp.tr('protein')} {mfp.tr('average')}={df_mfp['protein'].mean():.0f}g {mfp.tr('(blue/white/red)')}")
+    axis[1].set_title(f"{mfp.tr('protein')} {mfp.tr('average')}={average('protein'):.0f}g {mfp.tr('(blue/white/red)')}")
 
     calplot.yearplot(data = df_mfp['fat'],
                      cmap = 'bwr',
@@ -133,7 +205,7 @@ def year_nutrients_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> Byte
                      monthlabels=mfp.monthlabels,
                      ax=axis[2]
                     )
-    axis[2].set_title(f"{mfp.tr('fats')} {mfp.tr('average')}={df_mfp['fat'].mean():.0f}g {mfp.tr('(blue/white/red)')}")
+    axis[2].set_title(f"{mfp.tr('fats')} {mfp.tr('average')}={average('fat'):.0f}g {mfp.tr('(blue/white/red)')}")
 
     calplot.yearplot(data =  df_mfp['sugar'],
                      cmap = 'bwr',
@@ -145,14 +217,16 @@ def year_nutrients_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int) -> Byte
                      monthlabels=mfp.monthlabels,
                      ax=axis[3]
                     )
-    axis[3].set_title(f"{mfp.tr('sugar')} {mfp.tr('average')}={df_mfp['sugar'].mean():.0f}g {mfp.tr('(blue/white/red)')}")
+    axis[3].set_title(f"{mfp.tr('sugar')} {mfp.tr('average')}={average('sugar'):.0f}g {mfp.tr('(blue/white/red)')}")
+    return figure
 
-    buf = BytesIO()
-    figure.savefig(buf, format='pdf', bbox_inches='tight')
-    return buf
+@timed('nutrients_heatmap')
+def year_nutrients_heatmap(mfp: MFPReport, df_mfp: DataFrame, year: int, df_cube: DataFrame=None) -> BytesIO:
+    """ plot heatmap of food groups from mfp """
+    return save_figure(nutrients_figure(mfp, year, cached_series(nutrients_data, mfp, df_mfp, year, df_cube)))['pdf']
 
-def weight_graph(mfp: MFPReport, df_body: DataFrame, start_date, end_date) -> BytesIO:
-    """ generate a pdf chart of weight versus maximum trends """
+def weight_data(mfp: MFPReport, df_body: DataFrame, start_date, end_date) -> dict:
+    """ the lines of the weight chart, independent of language """
 
     if mfp.dieet_start is None:
         plan_date = start_date
@@ -179,56 +253,69 @@ def weight_graph(mfp: MFPReport, df_body: DataFrame, start_date, end_date) -> By
     idx = pd.date_range(df_calc.index[0].value, df_calc.index[-1].value)
     df_calc = df_calc.reindex(idx)
 
-    legend_list = []
-    figure, axis = plt.subplots(figsize=(mfp.landscape_width,mfp.landscape_height))
-    axis.yaxis.tick_right()
-    axis.yaxis.set_label_position("right")
-
+    data = {}
     xline = np.linspace( df_calc.index[1].value, df_calc.index[-1].value, len( df_calc.index) * 100)
-    tline = pd.to_datetime(xline)
+    data['plan_line'] = pd.to_datetime(xline)
 
     df_calc['hamster'] = df_calc['hamster'].interpolate(method ='time',
                                                limit_direction ='forward')
-    legend_list.append(mfp.tr('assessment line healthy weight loss'))
-    hamster_onder = np.interp(tline, df_calc.index,  df_calc['hamster'] )
-    axis.plot(tline, hamster_onder, color='green', linewidth=1.5)
-
-    legend_list.append(mfp.tr('assessment line deterioration'))
-    hamster_top = np.interp(tline, df_calc.index,  df_calc['hamster'] + 2)
-    axis.plot(tline, hamster_top, color='orange', linewidth=0.5)
+    data['plan_bottom'] = np.interp(data['plan_line'], df_calc.index,  df_calc['hamster'] )
+    data['plan_top'] = np.interp(data['plan_line'], df_calc.index,  df_calc['hamster'] + 2)
 
     df_calc['weight_time'] = df_calc['bodyweight'].interpolate(method ='time',
                                                   limit_direction ='backward')
     df_calc.dropna(axis=0, inplace=True, subset=['weight_time'])
 
     xline = np.linspace( df_calc.index[1].value, df_calc.index[-1].value, len( df_calc.index) * 100)
-    tline = pd.to_datetime(xline)
+    data['tline'] = pd.to_datetime(xline)
 
-    # legend_list.append('weight_time')
     # weight_time = np.interp(t, df_calc.index,  df_calc['weight_time'])
-    # axis.plot(t, weight_time)
 
-    legend_list.append(mfp.tr('body weight'))
     df_calc['weight_poly'] = df_calc['bodyweight'].interpolate(method='akima', order=5)
     # df_calc['weight_poly'] = df_calc['weight'].interpolate(method='linear', order=5)
-    weight_poly = np.interp(tline, df_calc.index,  df_calc['weight_poly'])
-    axis.plot(tline, weight_poly, color='steelblue', linewidth=2)
+    data['weight_poly'] = np.interp(data['tline'], df_calc.index,  df_calc['weight_poly'])
+    data['measured'] = df_calc['bodyweight']
+    data['hamster_bottom'] = np.interp(data['tline'], df_calc.index,  df_calc['hamster'] )
+    data['hamster_top'] = np.interp(data['tline'], df_calc.index,  df_calc['hamster'] + 2)
+
+    df_calc = df_calc[~((df_calc.index < start_date) | (df_calc.index > end_date))]
+    data['ylim'] = [ round( (df_calc.bodyweight.min() - 4) / 2) * 2 , round( (df_calc.bodyweight.max() + 4 ) / 2) * 2]
+    data['last_day'] = df_calc.index[-1]
+    return data
+
+def weight_figure(mfp: MFPReport, start_date, end_date, data: dict) -> Figure:
+    """ draw the weight chart from weight_data """
+
+    legend_list = []
+    figure, axis = plt.subplots(figsize=(mfp.landscape_width,mfp.landscape_height))
+    axis.yaxis.tick_right()
+    axis.yaxis.set_label_position("right")
+
+    legend_list.append(mfp.tr('assessment line healthy weight loss'))
+    axis.plot(data['plan_line'], data['plan_bottom'], color='green', linewidth=1.5)
+
+    legend_list.append(mfp.tr('assessment line deterioration'))
+    axis.plot(data['plan_line'], data['plan_top'], color='orange', linewidth=0.5)
+
+    # legend_list.append('weight_time')
+    # axis.plot(t, weight_time)
+
+    legend_list.append(mfp.tr('body weight'))
+    axis.plot(data['tline'], data['weight_poly'], color='steelblue', linewidth=2)
 
     legend_list.append(mfp.tr('measurement'))
-    axis.plot(df_calc.index, df_calc['bodyweight'], 'o', markersize=5, color='steelblue', mfc='white')
+    axis.plot(data['measured'].index, data['measured'], 'o', markersize=5, color='steelblue', mfc='white')
 
     axis.xaxis.set_major_formatter(mdates.DateFormatter("%b %y"))
     plt.title(mfp.tr('weight progression chart'))
 
     legend_list.append(mfp.tr('lose weight too fast'))
-    hamster_onder = np.interp(tline, df_calc.index,  df_calc['hamster'] )
-    axis.fill_between(tline, hamster_onder, weight_poly,
-                  where=weight_poly<hamster_onder, facecolor='lightblue', alpha=1)
+    axis.fill_between(data['tline'], data['hamster_bottom'], data['weight_poly'],
+                  where=data['weight_poly']<data['hamster_bottom'], facecolor='lightblue', alpha=1)
 
     legend_list.append(mfp.tr('relapse period'))
-    hamster_top = np.interp(tline, df_calc.index,  df_calc['hamster'] + 2)
-    axis.fill_between(tline, hamster_top, weight_poly,
-                      where=weight_poly>hamster_top, facecolor='darksalmon', alpha=1)
+    axis.fill_between(data['tline'], data['hamster_top'], data['weight_poly'],
+                      where=data['weight_poly']>data['hamster_top'], facecolor='darksalmon', alpha=1)
 
     axis.yaxis.set_major_formatter(mpl.ticker.StrMethodFormatter("{x:.1f}")) #{x:,.0f}'))
 
@@ -244,20 +331,23 @@ def weight_graph(mfp: MFPReport, df_body: DataFrame, start_date, end_date) -> By
     axis.yaxis.set_tick_params(labelsize=6)
     axis.xaxis.set_tick_params(labelsize=8)
 
-    df_calc = df_calc[~((df_calc.index < start_date) | (df_calc.index > end_date))]
-    axis.set_ylim([ round( (df_calc.bodyweight.min() - 4) / 2) * 2 , round( (df_calc.bodyweight.max() + 4 ) / 2) * 2])
+    axis.set_ylim(data['ylim'])
     axis.set_xlim([ start_date, end_date])
 
-    axis.text(axis.get_xlim()[-1] - 2, axis.get_ylim()[0] + 0.2, df_calc.index[-1].strftime("%A, %d %b %Y"),
+    axis.text(axis.get_xlim()[-1] - 2, axis.get_ylim()[0] + 0.2, data['last_day'].strftime("%A, %d %b %Y"),
             ha="right", backgroundcolor='1.', fontsize=5)
+    return figure
 
-    buf = BytesIO()
-    figure.savefig(buf, format='pdf', bbox_inches='tight')
-    return buf
+@timed('weight_graph')
+def weight_graph(mfp: MFPReport, df_body: DataFrame, start_date, end_date, data: dict=None) -> BytesIO:
+    """ generate a pdf chart of weight versus maximum trends, data from weight_data can be shared between languages """
+    if data is None:
+        data = cached_series(weight_data, mfp, df_body, start_date, end_date)
+    return save_figure(weight_figure(mfp, start_date, end_date, data))['pdf']
 
 
-def calorie_graph(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_date, end_date) -> BytesIO:
-    """ generate a pdf chart of weight loss and gain """
+def calorie_data(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_date, end_date) -> dict:
+    """ bmr, tdee and the lines of the calorie chart, independent of language """
 
     birthday = dateparse(mfp.birthday).date()
     birthday = dt.datetime(
@@ -271,12 +361,10 @@ def calorie_graph(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_d
     df_calc['age'] = (df_calc.index - birthday).days/365
     df_calc['bodyweight'] = df_calc['bodyweight'].interpolate(method ='time', limit_direction ='forward')
     if mfp.gender == 'male':
-        based_on = mfp.tr('male')
         df_calc['bmr_harris_benedict'] = 88.362 + (13.397*df_calc['bodyweight']) + (4.799*height) - (5.677*df_calc['age'])
         df_calc['bmr_mifflin_st_jeor'] = (10*df_calc['bodyweight']) + (6.25*height) - (5*df_calc['age']) + 5
         df_calc['bmr_katch_mcardle'] = 370 + (21.6 * ((0.407*df_calc['bodyweight']) + (0.267*height) - 19.2))
     else:
-        based_on = mfp.tr('female')
         df_calc['bmr_harris_benedict'] = 447.593 + (9.247*df_calc['bodyweight']) + (3.098*height) - (4.330*df_calc['age'])
         df_calc['bmr_mifflin_st_jeor'] = (10*df_calc['bodyweight']) + (6.25*height) - (5*df_calc['age']) - 161
         df_calc['bmr_katch_mcardle'] = 370 + (21.6 * ((0.252*df_calc['bodyweight']) + (0.473*height) - 48.3))
@@ -298,6 +386,29 @@ def calorie_graph(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_d
     df_calc.dropna(inplace=True, subset=['tdee_sedentary_ma7'])
     df_calc = df_calc[~((df_calc.index < start_date) | (df_calc.index > end_date))]
 
+    data = {'tdee': int(df_calc[mfp.formula][-1] * mfp.multiplier),
+            'bmr_harris_benedict': int(df_calc['bmr_harris_benedict'][-1]),
+            'bmr_mifflin_st_jeor': int(df_calc['bmr_mifflin_st_jeor'][-1]),
+            'bmr_katch_mcardle': int(df_calc['bmr_katch_mcardle'][-1]),
+            'lean_body_mass': 'fat_percentage' in df_calc,
+            'last_day': df_calc.index[-1]}
+
+    xline = np.linspace( df_calc.index[0].value, df_calc.index[-1].value, len( df_calc.index) * 100)
+    data['tline'] = pd.to_datetime(xline)
+    data['tdee_sedentary_ma7'] = np.interp(data['tline'], df_calc.index,  df_calc['tdee_sedentary_ma7'])
+    # print(df_calc['bmr'].head(20))
+    data['bmr'] = np.interp(data['tline'], df_calc.index,  df_calc['bmr'])
+    # bodyweight = np.interp(t, df_gewicht.index,  df_gewicht['bodyweight'])
+    return data
+
+def calorie_figure(mfp: MFPReport, df_mfp: DataFrame, start_date, end_date, data: dict) -> Figure:
+    """ draw the calorie chart from calorie_data, df_mfp for the scatter points """
+
+    based_on = mfp.tr('male') if mfp.gender == 'male' else mfp.tr('female')
+    tline = data['tline']
+    tdee_sedentary_ma7 = data['tdee_sedentary_ma7']
+    bmr = data['bmr']
+
     figure, axis = plt.subplots(figsize=(mfp.landscape_width,mfp.landscape_height))
     axis.yaxis.tick_right()
     axis.yaxis.set_label_position("right")
@@ -305,22 +416,15 @@ def calorie_graph(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_d
     # make the graphs
     legend_list = []
     bmr_legend = []
-    bmr_legend.append(f"{mfp.tr('TDEE is')} {int(df_calc[mfp.formula][-1] * mfp.multiplier)}")
-    bmr_legend.append(f"BMR Harris-Benedict, {based_on} formula: {int(df_calc['bmr_harris_benedict'][-1])}")
-    bmr_legend.append(f"BMR Mifflin St Jeor, {based_on} formula: {int(df_calc['bmr_mifflin_st_jeor'][-1])}")
-    if mfp.formula == 'bmr_katch_mcardle' and 'fat_percentage' in df_calc:
+    bmr_legend.append(f"{mfp.tr('TDEE is')} {data['tdee']}")
+    bmr_legend.append(f"BMR Harris-Benedict, {based_on} formula: {data['bmr_harris_benedict']}")
+    bmr_legend.append(f"BMR Mifflin St Jeor, {based_on} formula: {data['bmr_mifflin_st_jeor']}")
+    if mfp.formula == 'bmr_katch_mcardle' and data['lean_body_mass']:
         based_on = mfp.tr('lean body mass')
-    bmr_legend.append(f"BMR Katch–McArdle, {based_on} formula: {int(df_calc['bmr_katch_mcardle'][-1])}")
+    bmr_legend.append(f"BMR Katch–McArdle, {based_on} formula: {data['bmr_katch_mcardle']}")
     bmr_legend.append(f"{mfp.tr('Multiplier')} x{mfp.multiplier}")
     bmr_legend.append(f"{mfp.tr('Equation used')} {mfp.formula}")
 
-    xline = np.linspace( df_calc.index[0].value, df_calc.index[-1].value, len( df_calc.index) * 100)
-    tline = pd.to_datetime(xline)
-    tdee_sedentary_ma7 = np.interp(tline, df_calc.index,  df_calc['tdee_sedentary_ma7'])
-    # print(df_calc['bmr'].head(20))
-    bmr = np.interp(tline, df_calc.index,  df_calc['bmr'])
-
-    # bodyweight = np.interp(t, df_gewicht.index,  df_gewicht['bodyweight'])
     legend_list.append(mfp.tr('average weekly calorie expenditure'))
     axis.plot(tline, tdee_sedentary_ma7, color='steelblue', linewidth=1)
     axis.yaxis.set_tick_params(labelsize=6)
@@ -361,9 +465,33 @@ def calorie_graph(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_d
             "\n".join(["  " + bmr for bmr in bmr_legend]),
             backgroundcolor='1.', fontsize=6)
     axis.text(axis.get_xlim()[-1] - 2, axis.get_ylim()[0] + 85,
-            df_calc.index[-1].strftime('%A, %d %b %Y'),
+            data['last_day'].strftime('%A, %d %b %Y'),
             ha="right", backgroundcolor='1.', fontsize=5)
-
-    buf = BytesIO()
-    figure.savefig(buf, format='pdf', bbox_inches='tight')
-    return buf
+    return figure
+
+@timed('calorie_graph')
+def calorie_graph(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_date, end_date, data: dict=None) -> BytesIO:
+    """ generate a pdf chart of weight loss and gain, data from calorie_data can be shared between languages """
+    if data is None:
+        data = cached_series(calorie_data, mfp, df_mfp, df_body, start_date, end_date)
+    return save_figure(calorie_figure(mfp, df_mfp, start_date, end_date, data))['pdf']
+
+@timed('html_charts')
+def chart_files(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame, start_date, end_date, directory,
+                formats: tuple=('pdf', 'png', 'svg')) -> list:
+    """ write the weight and calorie charts in every format from one computation
+
+        returns [(title, {format: filename})] """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    figures = [('weight', mfp.tr('weight progression chart'),
+                weight_figure(mfp, start_date, end_date, cached_series(weight_data, mfp, df_body, start_date, end_date))),
+               ('calories', mfp.tr('calorie balance chart'),
+                calorie_figure(mfp, df_mfp, start_date, end_date, cached_series(calorie_data, mfp, df_mfp, df_body, start_date, end_date)))]
+    charts = []
+    for name, title, figure in figures:
+        files = {}
+        for fmt, buf in save_figure(figure, formats).items():
+            files[fmt] = f"{name}.{fmt}"
+            write_if_changed(Path(directory, files[fmt]), buf.getvalue())
+        charts.append((title, files))
+    return charts
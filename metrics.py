@@ -0,0 +1,131 @@
+""" run metrics written as a prometheus textfile-collector file """
+# pylint: disable=line-too-long
+
+import functools
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Tuple
+
+try:
+    import resource
+except ImportError:     # not on windows
+    resource = None
+
+# seconds per stage, summed over the run
+DURATIONS: Dict[str, float] = {}
+# counters per (name, labels), labels as a tuple of (key, value) pairs
+COUNTERS: Dict[Tuple[str, tuple], float] = {}
+
+COUNTER_HELP = {
+    'days_fetched': "Days fetched from myfitnesspal.",
+    'rows_written': "Csv rows appended.",
+    'pages_rendered': "Pdf pages added to an output file.",
+    'output_bytes': "Bytes of the output files written.",
+    'outputs_unchanged': "Output files not written again because their content did not change.",
+    'fetch_retries': "Requests retried after a transient error.",
+    'fetch_throttled': "Requests answered with 429 too many requests.",
+}
+
+
+def reset() -> None:
+    """ forget everything measured so far """
+    DURATIONS.clear()
+    COUNTERS.clear()
+
+@contextmanager
+def stage(name: str):
+    """ add the time spent in the block to stage name """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        DURATIONS[name] = DURATIONS.get(name, 0.0) + time.perf_counter() - start
+
+def timed(name: str):
+    """ decorator, every call of the function counts for stage name """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def count(name: str, value: float=1, **labels) -> None:
+    """ add value to a counter """
+    key = (name, tuple(sorted(labels.items())))
+    COUNTERS[key] = COUNTERS.get(key, 0) + value
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    """ record a hit or a miss of a cache """
+    count('cache_hits' if hit else 'cache_misses', cache=cache)
+
+def cache_summary() -> str:
+    """ hits and misses per cache, e.g. 'query 12/3, series 4/4' as hits/misses """
+    caches = sorted({dict(extra)['cache'] for (key, extra) in COUNTERS if key in ('cache_hits', 'cache_misses')})
+    return ", ".join(f"{cache} {COUNTERS.get(('cache_hits', (('cache', cache),)), 0):.0f}/"
+                     f"{COUNTERS.get(('cache_misses', (('cache', cache),)), 0):.0f}" for cache in caches)
+
+def peak_rss() -> int:
+    """ maximum resident set size of this process in bytes, 0 when unknown """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024   # linux reports KiB
+
+def format_labels(labels: dict) -> str:
+    """ {a="b",c="d"} with escaped values """
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+def textfile(labels: dict, run_seconds: float, success: bool) -> str:
+    """ the metrics of this run in the prometheus text exposition format """
+    lines = []
+
+    def metric(name, kind, help_text, values):
+        lines.append(f"# HELP mfp_{name} {help_text}")
+        lines.append(f"# TYPE mfp_{name} {kind}")
+        for extra, value in values:
+            text = str(int(value)) if float(value).is_integer() else repr(float(value))
+            lines.append(f"mfp_{name}{format_labels({**labels, **extra})} {text}")
+
+    metric('run_duration_seconds', 'gauge', "Wall time of the run.", [({}, run_seconds)])
+    metric('run_success', 'gauge', "1 when the run ended without an exception.", [({}, int(success))])
+    metric('run_timestamp_seconds', 'gauge', "Unix time the run ended.", [({}, time.time())])
+    metric('stage_duration_seconds', 'gauge', "Seconds spent per stage in the run, load includes deriving totals and fetch includes session_setup.",
+           [({'stage': name}, seconds) for name, seconds in sorted(DURATIONS.items())])
+    for name, help_text in COUNTER_HELP.items():
+        metric(name, 'gauge', help_text,
+               [(dict(extra), value) for (key, extra), value in sorted(COUNTERS.items()) if key == name] or [({}, 0)])
+
+    caches = sorted({dict(extra)['cache'] for (key, extra) in COUNTERS if key in ('cache_hits', 'cache_misses')})
+    ratios = []
+    for cache in caches:
+        hits = COUNTERS.get(('cache_hits', (('cache', cache),)), 0)
+        misses = COUNTERS.get(('cache_misses', (('cache', cache),)), 0)
+        ratios.append(({'cache': cache}, hits / (hits + misses)))
+    if ratios:
+        metric('cache_hit_ratio', 'gauge', "Hits divided by lookups per cache.", ratios)
+    metric('peak_rss_bytes', 'gauge', "Maximum resident set size of the process.", [({}, peak_rss())])
+    return "\n".join(lines) + "\n"
+
+def write_textfile(directory, command: str, config: str, run_seconds: float, success: bool) -> Path:
+    """ write mfp_<command>_<config>.prom atomically, the collector never sees half a file """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    filename = Path(directory, f"mfp_{command}_{config}.prom")
+    content = textfile({'command': command, 'config': config}, run_seconds, success)
+    handle, temporary = tempfile.mkstemp(dir=directory, prefix=f".{filename.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return filename
@@ -7,17 +7,90 @@ import json
 import locale
 import logging
 
-from typing import Dict
+from collections import OrderedDict
+from typing import Dict, Protocol
 
+import bisect
+import copy
 import csv
+import hashlib
+import io
+import os
+import re
+import threading
+import time
 import datetime as dt
 import pandas as pd
 from pandas import DataFrame
 
-import myfitnesspal
+
+import csvio
+from metrics import timed, stage, count, cache_lookup
+from fetch import FetchController, transient, open_client, save_session
+from progress import Progress
 
 logger = logging.getLogger(__name__)
 
+# settings that only change the words and date formats of a report, not its numbers
+TEXT_SETTINGS = ['locale', 'rename', 'daylabels', 'monthlabels', 'meals', 'totals', 'scatter', 'tooltip',
+                 'replace_parts_before', 'return_on', 'remove_parts', 'remove_words', 'replace_parts_after']
+
+# totals calculated from the stored totals when loading, older csv files also contain them
+DERIVED_TOTALS = ['netcalories', 'bmr', 'food_only']
+# settings the DERIVED_TOTALS depend on, files that store derived totals are rebuilt when they change
+DERIVED_SETTINGS = ['alcohol']
+# a stored derived total row, as written by to_csv before they were derived
+DERIVED_ROW = re.compile(rb"^\d{4}-\d{2}-\d{2},total-(?:" + b"|".join(x.encode() for x in DERIVED_TOTALS) + rb"),[^\n]*\n", re.MULTILINE)
+
+# derived total rows per loaded csv range and config, see MFPReport.derive_rows
+DERIVED_CACHE: Dict[tuple, DataFrame] = {}
+
+# memoized MFPReport.query results, per kind the frames of the current sources,
+# least recently used first, at most QUERY_CACHE_SIZE of them
+QUERY_CACHE: 'OrderedDict[tuple, tuple]' = OrderedDict()
+QUERY_CACHE_SIZE = 16
+
+# bytes of memory per csv byte while a chunk is loaded and pivoted, for memory_budget
+CSV_MEMORY_FACTOR = 6
+
+# held while the csv is appended, so a background sync never exposes half a day
+CSV_LOCK = threading.RLock()
+
+def wait_for_sync() -> None:
+    """ join the threads of a background sync, see MFPReport.sync """
+    for thread in threading.enumerate():
+        if thread.name == "sync" and thread is not threading.current_thread():
+            thread.join()
+
+def write_if_changed(filename, data: bytes) -> bool:
+    """ write an output file unless it already holds exactly data, returns whether it was written
+
+        the file is replaced in one go, rsync and backups never see half a file and
+        an unchanged file keeps its modification time """
+    try:
+        if os.path.getsize(filename) == len(data):
+            with open(filename, 'rb') as file:
+                if file.read() == data:
+                    count('outputs_unchanged')
+                    return False
+    except FileNotFoundError:
+        pass
+    temporary = f"{filename}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, filename)
+    count('output_bytes', len(data))
+    return True
+
+class DiaryClient(Protocol):
+    """ anything that serves diary days, myfitnesspal.Client or synthetic.FakeClient
+
+        get_date returns a day with .meals and .exercises (each .name and
+        .get_as_list()), .totals and .goals dictionaries """
+
+    def get_date(self, date: dt.date):
+        """ the diary of one day """
+
 
 class MFPReport:
     """ One place for variables """
@@ -28,6 +101,35 @@ class MFPReport:
         self.debug = True
         self.locale = "en_US.UTF-8"
         self.mfp_csv_file: str = "myfitnesspal_data.csv"
+        self.csv_compression: str = ''
+            # '' compresses by extension, .gz with gzip and .zst with zstd
+            # 'gzip' or 'zstd' whatever the extension, see csvio.py
+        self.sync_policy: str = 'always'
+            # when report commands fetch new days from myfitnesspal
+            # 'always'     sync before every report
+            # 'max_age'    skip when the csv was written less than sync_max_age hours ago
+            # 'daily'      sync at most once a day, skip when the csv was written today.
+            #              The csv holds complete days up to yesterday and to_csv resumes
+            #              after its last day, so the first run of a day fetches the days
+            #              finished since then and today itself is never fetched
+            # 'background' render with the current csv, sync in a thread meanwhile
+            # 'offline'    never sync, same as --offline
+        self.sync_max_age: float = 12        # in hours, for 'max_age'
+        self.memory_budget: int = 0
+            # in MB, 0 reads the whole csv at once when building the derived files
+            # else the csv is read in date ordered chunks that fit the budget,
+            # for very long histories (dense.py, foods.py)
+        # fetch.py pacing and retries of the myfitnesspal requests
+        self.fetch_concurrency: int = 4      # most requests in flight
+        self.fetch_rate: float = 5.0         # requests per second to start with
+        self.fetch_rate_max: float = 10.0    # requests per second at most
+        self.fetch_retries: int = 5          # per day, with exponential backoff
+        self.fetch_backoff: float = 1.0      # seconds before the first retry
+        self.fetch_backoff_max: float = 60.0
+        self.fetch_failures: int = 10
+            # stop after this many failed requests in a row, the next run
+            # continues after the last day written to the csv
+        self.session_max_age: float = 168   # in hours, reuse the saved myfitnesspal cookies this long
         self.weight_csv_file: str = "boditrax.csv"
             # contains at least two colums ['date', 'bodyweight']
             # if 'fatmass' present than fat_percentage will be calculated
@@ -49,6 +151,9 @@ class MFPReport:
 
         self.slip_up: int = -200
         self.output_directory: str = "output"
+        self.progress_interval: float = 30
+            # seconds between progress log lines of csv backfills and page renders
+            # when not on a terminal, a terminal shows a live progress bar instead
         self.landscape_width: float = 11          # in inches
         self.landscape_height: float = 8.5          # in inches
         self.report_pdf_options: dict = {
@@ -62,6 +167,13 @@ class MFPReport:
             'enable-local-file-access': True
         }
 
+        self.pdf_renderer: str = 'pdfkit'
+            # 'pdfkit' html through wkhtmltopdf
+            # 'native' draw the table in-process (pdftable.py), no wkhtmltopdf needed
+        self.pdf_styles: dict = {}
+            # native renderer only, override the style of a css class
+            # 'red': {'color': 'darkred', 'fontsize': 11}
+
         # graph.py change the headers and other stuff
         self.rename: dict = {}
         # incl this method: https://www.parool.nl/nieuws/want-to-lose-weight-show-your-hypothalamus-who-s-in-charge~be666c71/
@@ -100,9 +212,20 @@ class MFPReport:
             }
         }
 
+        # stats.py materialized rolling means over the daily totals
+        self.rolling_windows: list = [7, 14, 28, 90]      # in days
+        self.rolling_metrics: list = ['netcalories', 'calories', 'exercise',
+                                      'carbohydrates', 'protein', 'fat', 'sugar',
+                                      'bodyweight']
+            # any category from the csv totals or column from the weight file
+        # stats.py sum/count/mean per day, week, month and year
+        self.summary_categories: list = ['calories', 'netcalories', 'exercise',
+                                         'carbohydrates', 'protein', 'fat', 'sugar']
+
         # used by report.py for scrubbing the mfp desciption and make it nice
         self.report_css_file: str = "report.css"
         self.tooltip: bool = True             # For HTML output only
+        self.html_page_days: int = 7          # days per page for html --paged
         self.replace_parts_before: dict = {}
         self.return_on: dict = {}
         self.remove_parts: list = []
@@ -136,6 +259,15 @@ class MFPReport:
             for key, value in json.loads(file.read()).items():
                 setattr(self, key, value)
 
+    def text_layer(self, configfile: str) -> 'MFPReport':
+        """ copy of this report with only the TEXT_SETTINGS taken from configfile """
+        report = copy.copy(self)
+        with open(configfile, encoding='utf-8') as file:
+            for key, value in json.loads(file.read()).items():
+                if key in TEXT_SETTINGS:
+                    setattr(report, key, value)
+        return report
+
     def save_config(self, filename: str):
         """ Save configuration from a file """
         conf_items = {k: v for k, v in vars(self).items() if isinstance(v, (int, float, str, list, dict))}
@@ -143,6 +275,70 @@ class MFPReport:
             json.dump(conf_items, file, sort_keys=False, indent=2)
         print(f"config saved to: {filename}")
 
+    def config_digest(self) -> str:
+        """ hash of the settings that change numbers, TEXT_SETTINGS are left out """
+        config = {key: value for key, value in vars(self).items() if key not in TEXT_SETTINGS}
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def derived_digest(self) -> str:
+        """ hash of DERIVED_SETTINGS, kept by the files that store derived totals """
+        config = {key: getattr(self, key) for key in DERIVED_SETTINGS}
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def query(self, kind: str, start_date=None, end_date=None) -> DataFrame:
+        """ memoized frames for a date range, both ends included and open when None
+
+            'diary'  : the csv rows as load_df, from the normalized food tables (foods.py)
+            'totals' : the daily totals as pivot_df, from the dense file (dense.py)
+            'weight' : load_weight_df
+            'rollup' : the rollup cube (stats.py), the range is ignored
+            diary, totals and weight are read once and sliced. A result is reused until the
+            file it comes from or the config changes, or until QUERY_CACHE_SIZE more
+            recent results push it out. The frames are shared, copy before changing them """
+
+        sources = {'diary': [self.mfp_csv_file], 'totals': [self.mfp_csv_file],
+                   'weight': [self.weight_csv_file], 'rollup': [self.mfp_csv_file]}[kind]
+        version = tuple((x, os.stat(x).st_size, os.stat(x).st_mtime_ns) for x in sources) + (self.config_digest(),)
+        if kind == 'rollup':
+            start_date = end_date = None
+        start = None if start_date is None else pd.Timestamp(start_date)
+        end = None if end_date is None else pd.Timestamp(end_date)
+
+        key = (kind, start, end)
+        cached = QUERY_CACHE.get(key)
+        cache_lookup('query', cached is not None and cached[0] == version)
+        if cached is not None and cached[0] == version:
+            QUERY_CACHE.move_to_end(key)
+            return cached[1]
+
+        if start is None and end is None:
+            if kind == 'diary':
+                from foods import update_foods, load_diary      # pylint: disable=import-outside-toplevel,cyclic-import
+                update_foods(self)
+                result = load_diary(self)
+            elif kind == 'totals':
+                from dense import update_dense      # pylint: disable=import-outside-toplevel,cyclic-import
+                result = update_dense(self).frame()
+            elif kind == 'weight':
+                result = self.load_weight_df()
+            else:
+                from stats import update_rollup     # pylint: disable=import-outside-toplevel,cyclic-import
+                result = update_rollup(self, self.query('totals'))
+        else:
+            frame = self.query(kind)
+            first = frame.index.min() if start is None else start
+            last = frame.index.max() if end is None else end
+            result = frame[(frame.index >= first) & (frame.index <= last)]
+
+        # results of older versions of the sources are dropped
+        for old in [x for x, value in QUERY_CACHE.items() if x[0] == kind and value[0] != version]:
+            del QUERY_CACHE[old]
+        QUERY_CACHE[key] = (version, result)
+        QUERY_CACHE.move_to_end(key)
+        while len(QUERY_CACHE) > QUERY_CACHE_SIZE:
+            QUERY_CACHE.popitem(last=False)
+        return result
+
     def load_weight_df(self) -> DataFrame:
         """ load csv weight into DataFrame """
         df_body = pd.read_csv(self.weight_csv_file)
@@ -156,13 +352,90 @@ class MFPReport:
             logger.warning("'fatmass' not in dataset, 'fat_percentage' can not be calculated.")
         return df_body
 
-    def load_df(self) -> DataFrame:
-        """ load csv into dataframe """
-        df_data = pd.read_csv(self.mfp_csv_file)
-        df_data['date'] = pd.to_datetime(df_data['date'])
+    @timed('load')
+    def load_df(self, start_date=None, end_date=None, cache: bool=True) -> DataFrame:
+        """ load csv into dataframe, with a date range only that part of the file is parsed
+
+            cache=False leaves the derived rows of this range out of DERIVED_CACHE """
+        with CSV_LOCK:
+            if start_date is None and end_date is None:
+                with csvio.open_csv(self.mfp_csv_file, self.csv_compression) as file:
+                    df_data = pd.read_csv(file, engine='c')
+            else:
+                index = self.load_index()
+                begin = self.date_offset(index, start_date)
+                end = self.date_offset(index, end_date, after=True)
+                with csvio.open_csv(self.mfp_csv_file, self.csv_compression) as file:
+                    header = file.readline()
+                chunk = csvio.read_range(self.mfp_csv_file, index, begin, end, self.csv_compression)
+                df_data = pd.read_csv(io.BytesIO(header + chunk), engine='c')
+            stat = os.stat(self.mfp_csv_file)
+        df_data['date'] = pd.to_datetime(df_data['date'], format='%Y-%m-%d')
         df_data.set_index('date', inplace=True)
-        return df_data
-
+        key = (self.mfp_csv_file, stat.st_size, stat.st_mtime_ns, f"{start_date}", f"{end_date}") if cache else None
+        return self.derive_rows(df_data, key=key)
+
+    def chunks(self, start_date=None, end_date=None) -> list:
+        """ [(first, last), ...] dates of consecutive csv parts that fit memory_budget
+
+            one part for the whole range without a budget, a single day larger
+            than the budget is a part of its own """
+        if self.memory_budget <= 0:
+            return [(start_date, end_date)]
+        index = self.load_index()
+        limit = self.memory_budget * 1024 * 1024 / CSV_MEMORY_FACTOR
+        first = 0 if start_date is None else bisect.bisect_left(index['dates'], f"{start_date:%Y-%m-%d}")
+        last = len(index['dates']) if end_date is None else bisect.bisect_right(index['dates'], f"{end_date:%Y-%m-%d}")
+        bounds = index['offsets'] + [index['end']]
+        parts = []
+        begin = first
+        for looper in range(first, last):
+            if looper > begin and bounds[looper + 1] - bounds[begin] > limit:
+                parts.append((index['dates'][begin], index['dates'][looper - 1]))
+                begin = looper
+        if begin < last:
+            parts.append((index['dates'][begin], index['dates'][last - 1]))
+        return [tuple(dt.datetime.strptime(x, '%Y-%m-%d') for x in part) for part in parts]
+
+    def iter_df(self, start_date=None, end_date=None):
+        """ load_df part by part in date order, see chunks, the parts are not cached """
+        for first, last in self.chunks(start_date, end_date):
+            yield self.load_df(first, last, cache=self.memory_budget <= 0)
+
+    def derive_totals(self, df_mfp: DataFrame) -> DataFrame:
+        """ the DERIVED_TOTALS columns for a pivot_df frame, they follow the current config """
+        df_derived = pd.DataFrame(index=df_mfp.index)
+        if 'calories' not in df_mfp:
+            return df_derived
+        df_derived['netcalories'] = df_mfp['calories'] + df_mfp['exercise']
+        df_derived['bmr'] = df_mfp['goal'] - df_mfp['calories']
+        if self.alcohol in df_mfp:
+            df_derived['food_only'] = df_mfp['calories'] - df_mfp[self.alcohol]
+        return df_derived
+
+    def derive_rows(self, df_data: DataFrame, key: tuple=None) -> DataFrame:
+        """ replace the stored derived total rows of a load_df frame by freshly derived ones
+
+            the derived rows are cached on key plus the config they depend on """
+        stored = df_data['type'].isin([f"total-{x}" for x in DERIVED_TOTALS])
+        df_base = df_data[~stored]
+        cache_key = None if key is None else key + (self.alcohol,)
+        df_rows = DERIVED_CACHE.get(cache_key)
+        if cache_key is not None:
+            cache_lookup('derived', df_rows is not None)
+        if df_rows is None:
+            df_derived = self.derive_totals(self.pivot_df(df_base))
+            df_stacked = df_derived.stack().dropna().astype('int64') if len(df_derived.columns) > 0 else pd.Series(dtype='int64', index=pd.MultiIndex.from_arrays([pd.DatetimeIndex([], name='date'), []]))
+            df_rows = pd.DataFrame({'type': 'total-' + df_stacked.index.get_level_values(1),
+                                    'calories': df_stacked.values},
+                                   index=df_stacked.index.get_level_values(0))
+            if cache_key is not None:
+                if len(DERIVED_CACHE) > 16:
+                    DERIVED_CACHE.clear()
+                DERIVED_CACHE[cache_key] = df_rows
+        return pd.concat([df_base, df_rows]).sort_index(kind='stable')
+
+    @timed('pivot')
     def pivot_df(self, df_data: DataFrame) -> DataFrame:
         """ load pivot totals into dataframe """
         df_mfp = df_data[df_data.type.str.startswith('total-')].copy()
@@ -175,93 +448,375 @@ class MFPReport:
         df_mfp.fillna(0)
         return df_mfp
 
-    def to_csv(self, start_date=None) -> None:
-        """ extract from myfitnesspal to csv """
+    def day_rows(self, date, day) -> list:
+        """ csv rows for one myfitnesspal day: entries, exercises and totals """
+
+        rows = []
+        totals: Dict[str, float] = {}
+        for meal in day.meals:
+            name = meal.name.title().lower()
+            total = 0
+            for entry in meal.get_as_list():
+                calories = entry['nutrition_information']['calories']
+                row = [ date,
+                        name,
+                        entry['name'],
+                        int(calories),
+                        entry['nutrition_information'] ]
+                rows.append(row)
+                total += calories
+
+            totals[name] = total
+
+        total_adjusted = 0
+        total_fitness = 0
+        for exercise in day.exercises:
+            name = exercise.name.title().lower()
+            if name == "cardiovascular":
+                for entry in exercise.get_as_list():
+                    calories = entry['nutrition_information']['calories burned'] * -1
+                    row = [ date,
+                            "exercise",
+                            entry['name'],
+                            int(calories),
+                            entry['nutrition_information'] ]
+                    rows.append(row)
+
+                    if "adjustment" in entry['name'].lower():
+                        total_adjusted += calories
+                    else:
+                        total_fitness += calories
+        totals['fitness'] = total_fitness
+        totals['adjusted'] = total_adjusted
+        totals['exercise'] = total_fitness + total_adjusted
+
+        for key, value in day.totals.items():
+            totals[key] = value
+
+        if 'calories' not in totals:
+            totals['calories'] = 0
+        totals['goal'] = day.goals['calories']
+        # netcalories, bmr and food_only are derived when loading, see derive_totals
+
+        for key, value in totals.items():
+            rows.append([ date, 'total-' + key, None, int(value) ])
+        return rows
+
+    def to_csv(self, start_date=None, client: DiaryClient=None) -> dict:
+        """ extract from myfitnesspal (or another client) to csv
+
+            returns days, calls, retries, throttled, errors, setup_seconds for opening the
+            session and seconds for fetching and writing the days. When the
+            requests keep failing the fetch stops with the reason in 'stopped',
+            the csv and its index end at the last complete day so the next run resumes there """
 
         try:
-            with open(self.mfp_csv_file, 'r', encoding=locale.getpreferredencoding()) as file:
-                last_line = file.readlines()[-1].split(",")[0]
-                start_date = dt.datetime.strptime(last_line, '%Y-%m-%d').date()
+            index = self.load_index()
+            if len(index['dates']) > 0:
+                start_date = dt.datetime.strptime(index['dates'][-1], '%Y-%m-%d').date()
                 start_date += dt.timedelta(days=1)
-            file = open(self.mfp_csv_file, 'a', newline='', encoding=locale.getpreferredencoding())
-            writer = csv.writer(file)
+            else:
+                print("WARNING: Existing CSV file does not contain a valid date")
         except FileNotFoundError:
-            file = open(self.mfp_csv_file, 'w', newline='', encoding=locale.getpreferredencoding())
-            writer = csv.writer(file)
-            row = ["date", "type", "description", "calories", "details"]
-            writer.writerow(row)
-        except ValueError:
-            print("WARNING: Last  of existing CSV file does not contain a valid date")
-            file = open(self.mfp_csv_file, 'a', newline='', encoding=locale.getpreferredencoding())
-            writer = csv.writer(file)
+            index = {'dates': [], 'offsets': []}
+            with csvio.Appender(self.mfp_csv_file, index, self.csv_compression) as appender:
+                appender.add(None, self.serialize_rows([["date", "type", "description", "calories", "details"]]))
+            self.save_index(index)
 
         days = int((dt.date.today() - start_date).days)
-        if days == 0:
-            return
+        summary = {'days': 0, 'calls': 0, 'retries': 0, 'throttled': 0, 'errors': 0,
+                   'setup_seconds': 0.0, 'seconds': 0.0}
+        if days <= 0:
+            return summary
 
         warn = True
-        client = myfitnesspal.Client()
-
-        for looper in range( days ):
-            date = start_date + dt.timedelta(looper)
-            print(f"Request: {date}")
-            day = client.get_date(date)
-
-            totals: Dict[str, float] = {}
-            for meal in day.meals:
-                name = meal.name.title().lower()
-                total = 0
-                for entry in meal.get_as_list():
-                    calories = entry['nutrition_information']['calories']
-                    row = [ date,
-                            name,
-                            entry['name'],
-                            int(calories),
-                            entry['nutrition_information'] ]
-                    writer.writerow(row)
-                    total += calories
-
-                totals[name] = total
-
-            total_adjusted = 0
-            total_fitness = 0
-            for exercise in day.exercises:
-                name = exercise.name.title().lower()
-                if name == "cardiovascular":
-                    for entry in exercise.get_as_list():
-                        calories = entry['nutrition_information']['calories burned'] * -1
-                        row = [ date,
-                                "exercise",
-                                entry['name'],
-                                int(calories),
-                                entry['nutrition_information'] ]
-                        writer.writerow(row)
-
-                        if "adjustment" in entry['name'].lower():
-                            total_adjusted += calories
-                        else:
-                            total_fitness += calories
-            totals['fitness'] = total_fitness
-            totals['adjusted'] = total_adjusted
-            totals['exercise'] = total_fitness + total_adjusted
-
-            for key, value in day.totals.items():
-                totals[key] = value
-
-            if 'calories' not in totals:
-                totals['calories'] = 0
-            totals['goal'] = day.goals['calories']
-            totals['netcalories'] = totals['calories'] + totals['exercise']
-            totals['bmr'] = totals['goal'] - totals['calories']
-
-            if self.alcohol in totals:
-                totals['food_only'] = totals['calories'] - totals[self.alcohol]
-            elif warn:
-                logger.warning(f"'{self.alcohol}' is not in the dataset. Is 'alcohol' set correctly?")
-                warn = False
-
-            for key, value in totals.items():
-                row = [ date, 'total-' + key, None, int(value) ]
-                writer.writerow(row)
-
-        file.close()
+        start = time.perf_counter()
+        own_client = client is None
+        if own_client:
+            client, new = open_client(self)
+            summary['calls'] += int(new)        # login
+        summary['setup_seconds'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        controller = FetchController(self, client)
+        appender = csvio.Appender(self.mfp_csv_file, index, self.csv_compression)
+        try:
+            with Progress("fetch", days, "days", self.progress_interval) as progress:
+                for date, day in controller.days(start_date + dt.timedelta(x) for x in range(days)):
+                    progress.advance(f"{date}")
+                    rows = self.day_rows(date, day)
+                    if warn and f"total-{self.alcohol}" not in [row[1] for row in rows]:
+                        logger.warning(f"'{self.alcohol}' is not in the dataset. Is 'alcohol' set correctly?")
+                        warn = False
+                    with CSV_LOCK:
+                        appender.add(f"{date:%Y-%m-%d}", self.serialize_rows(rows))
+                    summary['days'] += 1
+                    count('days_fetched')
+                    count('rows_written', len(rows))
+        except Exception as error:      # pylint: disable=broad-except
+            if not transient(error):
+                raise
+            summary['stopped'] = str(error)
+            logger.error(f"fetch stopped: {error}, the csv ends at {index['dates'][-1] if index['dates'] else 'its header'}, run again to resume")
+        finally:
+            with CSV_LOCK:
+                appender.close()
+                self.save_index(index)
+            summary['seconds'] = time.perf_counter() - start
+            for key, value in controller.stats.items():
+                summary[key] += value
+            if own_client:
+                save_session(self, client)
+        return summary
+
+    def sync_skip_reason(self) -> str:
+        """ why sync_policy skips fetching right now, empty when the sync should run """
+        if self.sync_policy == 'offline':
+            return "offline"
+        if not os.path.isfile(self.mfp_csv_file):
+            return ""
+        written = dt.datetime.fromtimestamp(os.stat(self.mfp_csv_file).st_mtime)
+        if self.sync_policy == 'max_age' and dt.datetime.now() - written < dt.timedelta(hours=self.sync_max_age):
+            return f"csv written {written:%Y-%m-%d %H:%M}, less than {self.sync_max_age} hours ago"
+        if self.sync_policy == 'daily' and written.date() == dt.date.today():
+            # a run earlier today already fetched up to yesterday, the last complete day
+            return f"csv already written today at {written:%H:%M}"
+        return ""
+
+    def sync(self) -> dict:
+        """ to_csv under sync_policy, logs the time and calls spent
+
+            with 'background' the sync runs in a thread named "sync" that is returned as
+            summary['thread']. The caller joins it before exiting, see wait_for_sync, at
+            interpreter shutdown the fetch pool no longer accepts requests """
+
+        reason = self.sync_skip_reason()
+        if reason:
+            logger.info(f"sync skipped: {reason}")
+            return {'days': 0, 'calls': 0, 'seconds': 0.0}
+
+        def run(summary: dict) -> dict:
+            start = time.perf_counter()
+            with stage('fetch'):
+                summary.update(self.to_csv())
+            summary['seconds'] = time.perf_counter() - start
+            logger.info(f"sync: {summary['days']} days, {summary['calls']} calls, {summary['retries']} retries, "
+                        f"{summary['throttled']} throttled in {summary['seconds']:.1f}s, "
+                        f"{summary['setup_seconds']:.1f}s of it session setup")
+            return summary
+
+        if self.sync_policy == 'background':
+            summary: dict = {}
+            summary['thread'] = threading.Thread(target=run, args=(summary,), name="sync")
+            summary['thread'].start()
+            return summary
+        return run({})
+
+    def serialize_rows(self, rows: list) -> bytes:
+        """ csv bytes exactly as written by to_csv """
+        buf = io.StringIO(newline='')
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue().encode(locale.getpreferredencoding())
+
+    def index_file(self) -> str:
+        """ sidecar file with the byte offset of every date in the csv """
+        return f"{self.mfp_csv_file}.idx"
+
+    def session_file(self) -> str:
+        """ sidecar file with the cookies of the myfitnesspal session """
+        return f"{self.mfp_csv_file}.session"
+
+    def foods_csv_file(self) -> str:
+        """ foods.py food dictionary of the csv """
+        return f"{self.mfp_csv_file}.foods.csv"
+
+    def entries_csv_file(self) -> str:
+        """ foods.py diary entries of the csv by food id """
+        return f"{self.mfp_csv_file}.entries.csv"
+
+    def totals_csv_file(self) -> str:
+        """ foods.py daily totals of the csv """
+        return f"{self.mfp_csv_file}.totals.csv"
+
+    def search_index_file(self) -> str:
+        """ search.py inverted index over the food descriptions of the csv """
+        return f"{self.mfp_csv_file}.search.npz"
+
+    def dense_file(self) -> str:
+        """ dense.py pivoted daily totals of the csv, its header in <dense_file>.json """
+        return f"{self.mfp_csv_file}.dense"
+
+    def rollup_csv_file(self) -> str:
+        """ stats.py sum/count/mean cube of the csv totals """
+        return f"{self.mfp_csv_file}.rollup.csv"
+
+    def rolling_csv_file(self) -> str:
+        """ stats.py rolling means over the csv totals and the weight """
+        return f"{self.mfp_csv_file}.rolling.csv"
+
+    def derived_files(self) -> list:
+        """ the files built from the csv, with their headers """
+        return [self.foods_csv_file(), self.entries_csv_file(), self.totals_csv_file(), self.search_index_file(),
+                self.dense_file(), f"{self.dense_file()}.json", self.rollup_csv_file(), f"{self.rollup_csv_file()}.json",
+                self.rolling_csv_file(), f"{self.rolling_csv_file()}.json"]
+
+    def save_index(self, index: dict) -> None:
+        """ store the index together with the size and time of the csv it describes """
+        stat = os.stat(self.mfp_csv_file)
+        index['size'] = stat.st_size
+        index['mtime'] = stat.st_mtime_ns
+        with open(self.index_file(), 'w', encoding='utf-8') as file:
+            json.dump(index, file)
+
+    def load_index(self) -> dict:
+        """ load the date index, extend it after an append or rebuild it when missing or stale
+
+            {'dates': ['2021-01-01', ...], 'offsets': [57, ...], 'end': .., 'members': [[0, 0], ...],
+             'size': .., 'mtime': ..}
+            offsets point at the first line of each date and end after the last one, both in
+            uncompressed bytes. members are the [raw, uncompressed] starts of the parts of a
+            compressed csv, see csvio.py. size and mtime are of the file on disk """
+
+        with CSV_LOCK:
+            stat = os.stat(self.mfp_csv_file)
+            try:
+                with open(self.index_file(), encoding='utf-8') as file:
+                    index = json.load(file)
+            except (FileNotFoundError, ValueError):
+                index = None
+            if index is not None and 'end' not in index:
+                index = None    # written before compressed csv files
+            if index is not None and index['size'] == stat.st_size and index['mtime'] == stat.st_mtime_ns:
+                return index
+
+            if index is not None and 0 < index['size'] <= stat.st_size and len(index['dates']) > 0:
+                try:
+                    last = csvio.read_range(self.mfp_csv_file, index, index['offsets'][-1], index['offsets'][-1] + 10, self.csv_compression)
+                except csvio.ERRORS:
+                    last = b''
+                if last != index['dates'][-1].encode('ascii'):
+                    index = None
+            else:
+                index = None
+            if index is not None:
+                # the csv grew, continue from the last indexed date that still matches,
+                # a compressed csv from its last member as that may have been written again
+                start, position = index['members'].pop() if index['members'] else (index['end'], index['end'])
+                first = bisect.bisect_left(index['offsets'], position)
+                del index['dates'][first:]
+                del index['offsets'][first:]
+            else:
+                logger.info(f"rebuilding index {self.index_file()}")
+                index = {'dates': [], 'offsets': [], 'members': []}
+                start, position = 0, 0
+
+            index['end'] = position
+            try:
+                for position, line in csvio.lines(self.mfp_csv_file, start, position, index['members'], self.csv_compression):
+                    index['end'] = position + len(line)
+                    try:
+                        date = dt.datetime.strptime(line[:10].decode('ascii'), '%Y-%m-%d').strftime('%Y-%m-%d')
+                        if len(index['dates']) == 0 or date > index['dates'][-1]:
+                            index['dates'].append(date)
+                            index['offsets'].append(position)
+                    except (UnicodeDecodeError, ValueError):
+                        pass    # header or multi-line description, belongs to the previous date
+            except csvio.Truncated:
+                return self.load_index()
+
+            self.save_index(index)
+            return index
+
+    def date_offset(self, index: dict, date, after: bool=False) -> int:
+        """ uncompressed byte offset of the first line on or after date, after=True skips the date itself """
+        if date is None:
+            return index['offsets'][0] if not after and len(index['offsets']) > 0 else index['end']
+        key = f"{date:%Y-%m-%d}"
+        position = bisect.bisect_right(index['dates'], key) if after else bisect.bisect_left(index['dates'], key)
+        if position < len(index['offsets']):
+            return index['offsets'][position]
+        return index['end']
+
+    def last_csv_date(self) -> dt.date:
+        """ date of the last day in the csv """
+        return dt.datetime.strptime(self.load_index()['dates'][-1], '%Y-%m-%d').date()
+
+    def resync(self, days: int=7, start_date=None, end_date=None, client: DiaryClient=None) -> dict:
+        """ re-fetch a date range from myfitnesspal and rewrite the days that changed
+
+            the csv is only rewritten from the first changed day onwards, a compressed
+            csv from the start of its member, everything before stays untouched on disk.
+            After a rewrite the derived_files are removed """
+
+        index = self.load_index()
+        if end_date is None:
+            end_date = self.last_csv_date()
+        # like to_csv up to yesterday, today is still being logged and would not be fetched again
+        end_date = min(end_date, dt.date.today() - dt.timedelta(days=1))
+        if start_date is None:
+            start_date = end_date - dt.timedelta(days=days - 1)
+
+        summary = {'checked': 0, 'changed': 0, 'rewritten': 0}
+        offset = self.date_offset(index, start_date)
+        if offset >= index['end']:
+            logger.warning(f"{start_date} is after the last date in {self.mfp_csv_file}, use to_csv")
+            return summary
+
+        # per day the bytes currently in the csv, from start_date until the end of the file
+        first = bisect.bisect_left(index['dates'], f"{start_date:%Y-%m-%d}")
+        tail = csvio.read_range(self.mfp_csv_file, index, offset, index['end'], self.csv_compression)
+        bounds = index['offsets'][first:] + [index['end']]
+        days_bytes: Dict[dt.date, bytes] = {}
+        for looper, date in enumerate(index['dates'][first:]):
+            date = dt.datetime.strptime(date, '%Y-%m-%d').date()
+            days_bytes[date] = tail[bounds[looper] - offset:bounds[looper + 1] - offset]
+
+        if client is None:
+            client, _ = open_client(self)
+        new_bytes: Dict[dt.date, bytes] = {}
+        controller = FetchController(self, client)
+        days = int((end_date - start_date).days) + 1
+        with Progress("resync", days, "days", self.progress_interval) as progress:
+            for date, day in controller.days(start_date + dt.timedelta(x) for x in range(days)):
+                progress.advance(f"{date}")
+                content = self.serialize_rows(self.day_rows(date, day))
+                summary['checked'] += 1
+                # day_rows leaves the derived totals out, older csv files still have them
+                stored = DERIVED_ROW.sub(b'', days_bytes.get(date, b''))
+                if content != stored:
+                    new_bytes[date] = content
+                    summary['changed'] += 1
+
+        if len(new_bytes) == 0:
+            return summary
+
+        first_changed = min(new_bytes)
+        offset += sum(len(content) for date, content in days_bytes.items() if date < first_changed)
+
+        with CSV_LOCK:
+            # a compressed csv is cut at the start of a member, the unchanged days from there are written again
+            cut = csvio.cut_point(self.mfp_csv_file, index, offset, self.csv_compression)
+            head = csvio.read_range(self.mfp_csv_file, index, cut, offset, self.csv_compression)
+            kept = []
+            previous, date = cut, None
+            for looper in range(bisect.bisect_left(index['offsets'], cut), bisect.bisect_left(index['offsets'], offset)):
+                kept.append((date, head[previous - cut:index['offsets'][looper] - cut]))
+                previous, date = index['offsets'][looper], index['dates'][looper]
+            kept.append((date, head[previous - cut:]))
+
+            csvio.truncate(self.mfp_csv_file, index, cut, self.csv_compression)
+            with csvio.Appender(self.mfp_csv_file, index, self.csv_compression) as appender:
+                for date, content in kept:
+                    if date is not None or content:
+                        appender.add(date, content)
+                for date in sorted(set(days_bytes) | set(new_bytes)):
+                    if date >= first_changed:
+                        appender.add(f"{date:%Y-%m-%d}", new_bytes.get(date, days_bytes.get(date, b'')))
+                        summary['rewritten'] += 1
+            self.save_index(index)
+
+            # the files built from the csv hold the old values, they are built again when used
+            for filename in self.derived_files():
+                if os.path.isfile(filename):
+                    os.remove(filename)
+        return summary
@@ -0,0 +1,205 @@
+""" draw the weekly report table straight to pdf, without wkhtmltopdf
+
+    the page is written as pdf operators with the Helvetica core fonts every
+    pdf viewer has, so no font is embedded and nothing is laid out twice """
+# pylint: disable=line-too-long
+# pylint: disable=too-many-locals
+
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List
+
+import textwrap
+import zlib
+from xml.dom.minidom import Document, Element
+
+import matplotlib
+import matplotlib.colors as mcolors
+
+from mfp import MFPReport
+
+# report.css translated to drawing styles, later classes win
+TABLE_STYLES: Dict[str, dict] = {
+    'header': {'fontsize': 10, 'weight': 'bold', 'align': 'left', 'border': 'grey'},
+    'meal': {'fontsize': 12, 'align': 'center', 'valign': 'center', 'width': 2.8},
+    'entry': {'fontsize': 10, 'background': '#f6f6f6', 'border_bottom': '#e6e6e6'},
+    'description': {'align': 'center', 'width': 5.4},
+    'calorie': {'align': 'right', 'width': 1.6},
+    'total': {'fontsize': 10, 'weight': 'bold', 'padding_bottom': 10},
+    'result': {'fontsize': 10},
+    'black': {'color': 'darkslateblue'},
+    'blue': {'color': 'blue'},
+    'magenta': {'color': 'magenta'},
+    'green': {'color': 'green'},
+    'red': {'color': 'red'},
+}
+
+DEFAULT_STYLE = {'fontsize': 10, 'weight': 'normal', 'color': 'black', 'background': None,
+                 'border': None, 'border_bottom': None, 'align': 'left', 'valign': 'top',
+                 'padding_bottom': 0, 'width': 1.0}
+
+# pdf font resource per font weight
+FONTS = {'normal': ('F1', 'Helvetica'), 'bold': ('F2', 'Helvetica-Bold')}
+
+# advance widths per character code of the FONTS, read from their afm files once
+FONT_WIDTHS: Dict[str, Dict[int, float]] = {}
+
+
+def cell_style(mfp: MFPReport, classes: str) -> dict:
+    """ combine the styles of all classes of a cell """
+    style = dict(DEFAULT_STYLE)
+    for name in classes.split():
+        style.update(TABLE_STYLES.get(name, {}))
+        style.update(mfp.pdf_styles.get(name, {}))
+    if not mcolors.is_color_like(style['color']):
+        style['color'] = 'black'
+    return style
+
+def font_widths(font: str) -> Dict[int, float]:
+    """ advance widths of the characters of a core font in 1/1000 of the font size,
+        from the afm files that come with matplotlib """
+    if font not in FONT_WIDTHS:
+        widths = {}
+        with open(Path(matplotlib.get_data_path(), 'fonts', 'pdfcorefonts', f"{font}.afm"), encoding='latin-1') as file:
+            for line in file:
+                if line.startswith('C '):
+                    fields = dict(x.strip().split(' ', 1) for x in line.split(';') if x.strip())
+                    widths[int(fields['C'])] = float(fields['WX'])
+        FONT_WIDTHS[font] = widths
+    return FONT_WIDTHS[font]
+
+def pdf_string(text: str) -> bytes:
+    """ text as a pdf string in WinAnsiEncoding, characters outside it become ? """
+    data = text.encode('cp1252', errors='replace')
+    return b"(" + b"".join(bytes([x]) if 32 <= x < 127 and x not in b"()\\" else f"\\{x:03o}".encode() for x in data) + b")"
+
+def text_width(text: str, font: str, size: float) -> float:
+    """ width of text in points, the afm codes match WinAnsiEncoding for ascii """
+    widths = font_widths(font)
+    return sum(widths.get(x, 556) for x in text.encode('cp1252', errors='replace')) * size / 1000
+
+def rgb(color: str) -> str:
+    """ a matplotlib color as pdf color operands """
+    return " ".join(f"{x:.3f}" for x in mcolors.to_rgb(color))
+
+def pdf_document(width: float, height: float, content: bytes) -> bytes:
+    """ a pdf of one page of width x height points drawn by content, with the FONTS """
+    stream = zlib.compress(content)
+    fonts = " ".join(f"/{name} {number} 0 R" for number, (name, _) in enumerate(FONTS.values(), 5))
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width:.2f} {height:.2f}] /Resources << /Font << {fonts} >> >> /Contents 4 0 R >>".encode(),
+               f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode() + stream + b"\nendstream"]
+    objects += [f"<< /Type /Font /Subtype /Type1 /BaseFont /{font} /Encoding /WinAnsiEncoding >>".encode() for _, font in FONTS.values()]
+
+    pdf = BytesIO()
+    pdf.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(pdf.tell())
+        pdf.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+    xref = pdf.tell()
+    pdf.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    pdf.write(b"".join(f"{x:010d} 00000 n \n".encode() for x in offsets))
+    pdf.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return pdf.getvalue()
+
+def cell_text(element: Element) -> str:
+    """ text of a cell without the tooltips """
+    return "".join(x.data for x in element.childNodes if x.nodeType == x.TEXT_NODE)
+
+def table_grid(mfp: MFPReport, dom: Document) -> List[dict]:
+    """ place the cells of the html table on a grid, honouring rowspan and colspan """
+    cells = []
+    occupied = set()
+    for row, tr in enumerate(dom.getElementsByTagName('tr')):
+        column = 0
+        for element in [x for x in tr.childNodes if x.nodeType == x.ELEMENT_NODE and x.tagName in ('td', 'th')]:
+            while (row, column) in occupied:
+                column += 1
+            rowspan = int(element.getAttribute('rowspan') or 1)
+            colspan = int(element.getAttribute('colspan') or 1)
+            for looper in range(rowspan):
+                for span in range(colspan):
+                    occupied.add((row + looper, column + span))
+            cells.append({'row': row, 'column': column, 'rowspan': rowspan, 'colspan': colspan,
+                          'text': cell_text(element),
+                          'style': cell_style(mfp, element.getAttribute('class'))})
+            column += colspan
+    return cells
+
+def render_table(mfp: MFPReport, dom: Document) -> BytesIO:
+    """ draw the df_to_xml table on one landscape page and return the pdf """
+
+    cells = table_grid(mfp, dom)
+    rows = max(x['row'] + x['rowspan'] for x in cells)
+    columns = max(x['column'] + x['colspan'] for x in cells)
+
+    # column widths from the classes of single column cells, scaled to the page
+    margin = 5 / 25.4 * 72
+    page_width = mfp.landscape_width * 72
+    page_height = mfp.landscape_height * 72
+    weights = [1.0] * columns
+    for cell in cells:
+        if cell['colspan'] == 1:
+            weights[cell['column']] = cell['style']['width']
+    widths = [(page_width - 2 * margin) * x / sum(weights) for x in weights]
+    lefts = [margin + sum(widths[:x]) for x in range(columns)]
+
+    def font_size(cell, scale):
+        return cell['style']['fontsize'] * 0.75 * scale     # css px to pt
+
+    def wrapped(cell, scale):
+        width = sum(widths[cell['column']:cell['column'] + cell['colspan']])
+        chars = max(1, int(width / (font_size(cell, scale) * 0.55)))
+        return textwrap.wrap(cell['text'], chars, break_long_words=False) or ['']
+
+    def row_heights(scale):
+        heights = [0.0] * rows
+        for cell in cells:
+            if cell['rowspan'] == 1:
+                height = len(wrapped(cell, scale)) * font_size(cell, scale) * 1.2 + 2 + cell['style']['padding_bottom'] * scale
+                heights[cell['row']] = max(heights[cell['row']], height)
+        return heights
+
+    # shrink everything until the table fits on the page
+    scale = 1.0
+    heights = row_heights(scale)
+    while sum(heights) > page_height - 2 * margin and scale > 0.3:
+        scale *= 0.95
+        heights = row_heights(scale)
+    tops = [margin + sum(heights[:x]) for x in range(rows)]
+
+    # pdf y runs up from the bottom of the page
+    ops = ["0.75 w"]
+    for cell in cells:
+        style = cell['style']
+        left = lefts[cell['column']]
+        top = tops[cell['row']]
+        width = sum(widths[cell['column']:cell['column'] + cell['colspan']])
+        height = sum(heights[cell['row']:cell['row'] + cell['rowspan']])
+        bottom = page_height - top - height
+        if style['background']:
+            ops.append(f"{rgb(style['background'])} rg {left:.2f} {bottom:.2f} {width:.2f} {height:.2f} re f")
+        if style['border']:
+            ops.append(f"{rgb(style['border'])} RG {left:.2f} {bottom:.2f} {width:.2f} {height:.2f} re S")
+        if style['border_bottom']:
+            ops.append(f"{rgb(style['border_bottom'])} RG {left:.2f} {bottom:.2f} m {left + width:.2f} {bottom:.2f} l S")
+        if not cell['text'].strip():
+            continue
+
+        name, font = FONTS['bold' if style['weight'] == 'bold' else 'normal']
+        size = font_size(cell, scale)
+        lines = wrapped(cell, scale)
+        line_height = size * 1.2
+        block_top = top + height / 2 - len(lines) * line_height / 2 if style['valign'] == 'center' else top + 1
+        ops.append(f"BT /{name} {size:.2f} Tf {rgb(style['color'])} rg")
+        for looper, line in enumerate(lines):
+            x = {'left': left + 2,
+                 'center': left + (width - text_width(line, font, size)) / 2,
+                 'right': left + width - 4 - text_width(line, font, size)}[style['align']]
+            baseline = page_height - (block_top + looper * line_height + size * 0.95)
+            ops.append(f"1 0 0 1 {x:.2f} {baseline:.2f} Tm {pdf_string(line).decode('latin-1')} Tj")
+        ops.append("ET")
+
+    return BytesIO(pdf_document(page_width, page_height, "\n".join(ops).encode('latin-1')))
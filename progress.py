@@ -0,0 +1,89 @@
+""" progress of long runs, a live bar on a terminal and periodic log lines otherwise """
+# pylint: disable=logging-fstring-interpolation
+
+import datetime as dt
+import logging
+import threading
+import time
+
+import rich
+import rich.progress
+
+logger = logging.getLogger(__name__)
+
+# one live display for the tasks that run at the same time, e.g. a background sync and the pages
+LIVE: dict = {'display': None, 'tasks': 0}
+LIVE_LOCK = threading.Lock()
+
+
+def duration(seconds: float) -> str:
+    """ seconds as 0:01:05 """
+    return str(dt.timedelta(seconds=int(seconds)))
+
+class Progress:
+    """ count units of work towards total, use as context manager and call advance() per unit
+
+        on a terminal a rich progress bar shows units/s, elapsed time and ETA. Without one,
+        like under cron, the same numbers are logged every interval seconds and when done """
+
+    def __init__(self, description: str, total: int, unit: str, interval: float=30):
+        self.description = description
+        self.total = total
+        self.unit = unit
+        self.interval = interval
+        self.live = rich.get_console().is_terminal
+        self.completed = 0
+        self.start = self.logged = time.perf_counter()
+        self.task = None
+
+    def __enter__(self):
+        self.start = self.logged = time.perf_counter()
+        if self.live:
+            with LIVE_LOCK:
+                if LIVE['display'] is None:
+                    LIVE['display'] = rich.progress.Progress(
+                        rich.progress.TextColumn("{task.description}"),
+                        rich.progress.BarColumn(),
+                        rich.progress.MofNCompleteColumn(),
+                        rich.progress.TextColumn("{task.fields[rate]}"),
+                        rich.progress.TimeElapsedColumn(),
+                        rich.progress.TextColumn("eta"),
+                        rich.progress.TimeRemainingColumn(),
+                        rich.progress.TextColumn("{task.fields[label]}"))
+                    LIVE['display'].start()
+                LIVE['tasks'] += 1
+                self.task = LIVE['display'].add_task(self.description, total=self.total,
+                                                     rate="", label="")
+        return self
+
+    def __exit__(self, *args):
+        if self.live:
+            with LIVE_LOCK:
+                LIVE['tasks'] -= 1
+                if LIVE['tasks'] == 0:
+                    LIVE['display'].stop()
+                    LIVE['display'] = None
+        else:
+            logger.info(f"{self.line()}, done")
+
+    def rate(self) -> float:
+        """ units per second so far """
+        return self.completed / max(time.perf_counter() - self.start, 1e-9)
+
+    def line(self) -> str:
+        """ one line with count, rate, elapsed time and ETA """
+        elapsed = time.perf_counter() - self.start
+        eta = (self.total - self.completed) / self.rate() if self.completed > 0 else 0
+        return (f"{self.description}: {self.completed}/{self.total} {self.unit}, "
+                f"{self.rate():.1f} {self.unit}/s, elapsed {duration(elapsed)}, "
+                f"eta {duration(eta) if self.completed > 0 else '?'}")
+
+    def advance(self, label: str="", amount: int=1) -> None:
+        """ amount more units done, label says which one """
+        self.completed += amount
+        if self.live:
+            LIVE['display'].update(self.task, advance=amount,
+                                   rate=f"{self.rate():.1f} {self.unit}/s", label=label)
+        elif time.perf_counter() - self.logged >= self.interval:
+            self.logged = time.perf_counter()
+            logger.info(f"{self.line()}, at {label}" if label else self.line())
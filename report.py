@@ -2,11 +2,16 @@
 # pylint: disable=expression-not-assigned
 # pylint: disable=line-too-long
 # pylint: disable=invalid-name
+# pylint: disable=import-outside-toplevel
 
 import os
 from io import BytesIO
+from pathlib import Path
 
 import datetime as dt
+import hashlib
+import json
+import locale
 import re
 
 from xml.dom.minidom import getDOMImplementation, Document, parseString
@@ -14,7 +19,9 @@ from xml.dom.minidom import getDOMImplementation, Document, parseString
 from pandas import DataFrame
 import pdfkit
 
-from mfp import MFPReport
+import csvio
+from mfp import MFPReport, write_if_changed
+from metrics import timed, cache_lookup, count
 
 def get_dom() -> Document:
     """ configure dom """
@@ -79,10 +86,36 @@ def clean_word(description: str, mfp: MFPReport) -> str:
 
     return description
 
-def html_report(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> BytesIO:
-    """ Generate a pretty HTML report """
-
-    dom = df_to_xml(mfp, df_data, start_date, end_date)
+def add_charts(dom: Document, charts: list) -> None:
+    """ the charts from graph.chart_files as lazily loaded png thumbnails, a thumbnail
+        opens the svg file of the chart, or links to the png without one """
+    div = dom.getElementsByTagName('body')[0].appendChild(dom.createElement("div"))
+    div.setAttribute('class', 'charts')
+    for title, files in charts:
+        if 'svg' in files:
+            # a closed details is not rendered, the lazy svg is only loaded when opened
+            chart = div.appendChild(dom.createElement("details"))
+            thumbnail = chart.appendChild(dom.createElement("summary"))
+            svg = chart.appendChild(dom.createElement("img"))
+            svg.setAttribute('src', files['svg'])
+            svg.setAttribute('alt', title)
+            svg.setAttribute('loading', 'lazy')
+        else:
+            thumbnail = chart = div.appendChild(dom.createElement("a"))
+            chart.setAttribute('href', files['png'])
+        img = thumbnail.appendChild(dom.createElement("img"))
+        img.setAttribute('src', files['png'])
+        img.setAttribute('alt', title)
+        img.setAttribute('title', title)
+        img.setAttribute('loading', 'lazy')
+
+def html_report(mfp: MFPReport, df_data: DataFrame, start_date, end_date, charts: list=None,
+                data: dict=None) -> BytesIO:
+    """ Generate a pretty HTML report, optionally with the charts written by graph.chart_files """
+
+    dom = df_to_xml(mfp, df_data, start_date, end_date, data)
+    if charts:
+        add_charts(dom, charts)
 
     if mfp.debug:
         # root = ET.fromstring(dom.toxml())
@@ -91,31 +124,127 @@ def html_report(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> Byt
         return xml_string
     return dom.toxml()
 
-def pdf_report(mfp: MFPReport, df_data: DataFrame, end_date) -> BytesIO:
-    """ Generate a PDF report """
+def page_fingerprint(mfp: MFPReport, start_date, end_date) -> str:
+    """ hash of the csv bytes of the dates on a page, the config that changes the output and the css """
+    index = mfp.load_index()
+    begin = mfp.date_offset(index, start_date)
+    end = mfp.date_offset(index, end_date, after=True)
+    digest = hashlib.sha1(csvio.read_range(mfp.mfp_csv_file, index, begin, end, mfp.csv_compression))
+    config = [mfp.locale, mfp.debug, mfp.alcohol, mfp.tooltip, mfp.report_css_file, mfp.meals, mfp.totals, mfp.rename,
+              mfp.replace_parts_before, mfp.return_on, mfp.remove_parts, mfp.remove_words, mfp.replace_parts_after,
+              f"{start_date:%Y-%m-%d}", f"{end_date:%Y-%m-%d}"]
+    digest.update(json.dumps(config, sort_keys=True).encode('utf-8'))
+    if mfp.report_css_file and Path(mfp.report_css_file).is_file():
+        digest.update(Path(mfp.report_css_file).read_bytes())
+    return digest.hexdigest()
+
+def html_pages(mfp: MFPReport, start_date, end_date, directory, span: int=7, charts: list=None) -> dict:
+    """ write one html page per span of days and an index page linking them, with the charts
+
+        pages are aligned on mondays so a page keeps its dates between runs,
+        a page is only rendered when its data or the config changed. Pages
+        of earlier runs that the index no longer links are removed """
+
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    manifest_file = Path(directory, 'pages.json')
+    try:
+        with open(manifest_file, encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    monday = dt.datetime(1970, 1, 5)
+    page_start = monday + dt.timedelta(days=((start_date - monday).days // span) * span)
+    summary = {'written': 0, 'skipped': 0}
+    pages = []
+    while page_start <= end_date:
+        first_day = max(page_start, start_date)
+        last_day = min(page_start + dt.timedelta(days=span - 1), end_date)
+        filename = f"report_{first_day:%Y-%m-%d}.html"
+        pages.append((filename, first_day, last_day))
+
+        fingerprint = page_fingerprint(mfp, first_day, last_day)
+        unchanged = manifest.get(filename) == fingerprint and Path(directory, filename).is_file()
+        cache_lookup('html_pages', unchanged)
+        if unchanged:
+            summary['skipped'] += 1
+        else:
+            # only this page is in memory, it is read once and not kept in the query or derived caches
+            xml_string = html_report(mfp, mfp.load_df(first_day, last_day, cache=False), first_day, last_day)
+            write_if_changed(Path(directory, filename), xml_string.encode(locale.getpreferredencoding()))
+            manifest[filename] = fingerprint
+            summary['written'] += 1
+        page_start += dt.timedelta(days=span)
+
+    # e.g. a partial first page whose first day is no longer the start of the range
+    current = {x[0] for x in pages}
+    for page in Path(directory).glob('report_*.html'):
+        if page.name not in current:
+            page.unlink()
+            count('html_pages_removed')
+    manifest = {key: value for key, value in manifest.items() if key in current}
+
+    dom = get_dom()
+    html = dom.documentElement
+    body = html.appendChild(dom.createElement("body"))
+    ul = body.appendChild(dom.createElement("ul"))
+    for filename, first_day, last_day in reversed(pages):
+        a = dom.createElement("a")
+        a.setAttribute('href', filename)
+        a.appendChild(dom.createTextNode(f"{first_day:%A %-d %b %Y} - {last_day:%A %-d %b %Y}"))
+        ul.appendChild(dom.createElement("li")).appendChild(a)
+    if charts:
+        add_charts(dom, charts)
+    write_if_changed(Path(directory, 'index.html'), dom.toxml().encode(locale.getpreferredencoding()))
+    write_if_changed(manifest_file, json.dumps(manifest, indent=2).encode('utf-8'))
+    return summary
+
+@timed('weekly_report')
+def pdf_report(mfp: MFPReport, df_data: DataFrame, end_date, data: dict=None) -> BytesIO:
+    """ Generate a PDF report, data is the table_data of the week when it is shared between languages """
 
     start_date = end_date - dt.timedelta(days=6)
-    dom = df_to_xml(mfp, df_data, start_date, end_date)
+    dom = df_to_xml(mfp, df_data, start_date, end_date, data)
     if mfp.tooltip:
         for tip in dom.getElementsByTagName('tip'):
             tip.parentNode.removeChild(tip)
+    if mfp.pdf_renderer == 'native':
+        from pdftable import render_table
+        return render_table(mfp, dom)
     buf = pdfkit.from_string( dom.toxml(), b'',
                               css=mfp.report_css_file,
                               options=mfp.report_pdf_options )
     return BytesIO(buf)
 
-def df_to_xml(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> Document:
-    """ make xml report from dataframe """
+def table_data(df_data: DataFrame, start_date, end_date) -> dict:
+    """ the part of the xml report that does not depend on the language: the rows of
+        every date and meal, the number of rows per meal and the meals and totals in the data """
+
+    df_xml = df_data[~((df_data.index < start_date) | (df_data.index > end_date))]
+    columns = ['description', 'calories', 'details']
+    cells = {key: list(group[columns].itertuples(index=False, name=None))
+             for key, group in df_xml.groupby([df_xml.index, 'type'], sort=False)}
+    types = df_xml.type.unique().tolist()
+    return {'cells': cells,
+            'descriptions': df_xml['description'].unique(),
+            'max_rows_per_meal': df_xml.groupby(['date', 'type'])['description'].count().groupby(level=1).max(),
+            'meals': [x for x in types if not x.startswith('total-')],
+            'totals': [x for x in types if x.startswith('total-')]}
 
-    df_xml = df_data[~((df_data.index < start_date) | (df_data.index > end_date))].copy()
+def df_to_xml(mfp: MFPReport, df_data: DataFrame, start_date, end_date, data: dict=None) -> Document:
+    """ make xml report from dataframe, or from its table_data """
 
-    df_xml['entry'] = df_xml['description'].apply(clean_word, mfp=mfp)
-    max_rows_per_meal = df_xml.groupby(['date', 'type'])['entry'].count().groupby(level=1).max()
+    if data is None:
+        data = table_data(df_data, start_date, end_date)
+    cells = data['cells']
+    max_rows_per_meal = data['max_rows_per_meal']
+
+    # clean every distinct food once, the same foods come back every week
+    entries = {description: clean_word(description, mfp) for description in data['descriptions']}
 
     # show all meals from the csv data even if missing in the configuration
-    meals_list = [x for x in df_xml.type.unique().tolist() if not x.startswith('total-')]
     all_meals_list = list(mfp.meals.keys())
-    all_meals_list.extend(x for x in meals_list if x not in all_meals_list)
+    all_meals_list.extend(x for x in data['meals'] if x not in all_meals_list)
 
     # show all the totals unless a configuration is found then only show those totals
     if mfp.totals:
@@ -126,7 +255,7 @@ def df_to_xml(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> Docum
                 if value.get('show', False):
                     totals_list.append(key)
     else:
-        totals_list = [x for x in df_xml.type.unique().tolist() if x.startswith('total-')]
+        totals_list = data['totals']
 
 
     dom = get_dom()
@@ -190,17 +319,13 @@ def df_to_xml(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> Docum
         for row in range(0, meals_rows):
 
             for date in daterange(start_date, end_date):
-                df_target = df_xml[(df_xml.index == date) & (df_xml.type == meal)]
-                answer = df_target[['entry',
-                                    'calories',
-                                    'description',
-                                    'details']].itertuples(index=False, name=None)
-                list_answer = list(answer)
+                list_answer = cells.get((date, meal), [])
 
                 if row >= len(list_answer):
                     entry = calorie = description = details = ""
                 else:
-                    entry, calorie, description, details = list_answer[row]
+                    description, calorie, details = list_answer[row]
+                    entry = entries.get(description, description)
 
                 td = dom.createElement("td")
                 td.setAttribute('class', meal_class + meal + ' entry description')
@@ -233,12 +358,8 @@ def df_to_xml(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> Docum
         tr.appendChild(td)
 
         for date in daterange(start_date, end_date):
-            key = "total-" + meal
-            result = df_xml[(df_xml.index == date) & (df_xml.type == key)]
-            if len(result) == 0:
-                tot = 0
-            else:
-                tot = result['calories'].values[0]
+            result = cells.get((date, "total-" + meal))
+            tot = result[0][1] if result else 0
 
             td = dom.createElement("td")
             td.setAttribute('class', meal_class + meal + ' total description')
@@ -272,11 +393,8 @@ def df_to_xml(mfp: MFPReport, df_data: DataFrame, start_date, end_date) -> Docum
                 total_class += ' '
 
             for date in daterange(start_date, end_date):
-                result = df_xml[(df_xml.index == date) & (df_xml.type == key)]
-                if len(result) == 0:
-                    total_value = 0
-                else:
-                    total_value = result['calories'].values[0]
+                result = cells.get((date, key))
+                total_value = result[0][1] if result else 0
 
                 td = dom.createElement("td")
                 td.setAttribute('class', total_class + key + ' result description')
@@ -0,0 +1,169 @@
+""" inverted index over the food history """
+# pylint: disable=line-too-long
+# pylint: disable=logging-fstring-interpolation
+
+import bisect
+import logging
+import re
+from typing import Dict, List
+
+import datetime as dt
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from mfp import MFPReport
+from foods import load_foods, load_entries, update_foods
+from report import clean_word
+from stats import ROLLUP_PERIODS
+
+logger = logging.getLogger(__name__)
+
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+def tokenize(text) -> set:
+    """ lowercase words in a description """
+    if not isinstance(text, str):
+        return set()
+    return set(re.findall(r"\w+", text.lower()))
+
+def empty_index() -> dict:
+    """ an index without foods or postings """
+    return {'tokens': {},                               # token -> food ids
+            'max_food_id': -1,
+            'days': np.array([], dtype=np.int32),      # days since 1970-01-01
+            'meals': np.array([], dtype=np.int16),     # position in meal_names
+            'meal_names': [],
+            'calories': np.array([], dtype=np.int32),
+            'food_ids': np.array([], dtype=np.int32)}
+
+def load_search_index(mfp: MFPReport) -> dict:
+    """ read the index from disk, tokens are stored as a sorted vocabulary with offsets """
+    try:
+        with np.load(mfp.search_index_file(), allow_pickle=False) as data:
+            vocabulary = data['vocabulary'].tolist()
+            offsets = data['offsets']
+            token_foods = data['token_foods']
+            index = {'tokens': {token: token_foods[offsets[looper]:offsets[looper + 1]].tolist()
+                                for looper, token in enumerate(vocabulary)},
+                     'max_food_id': int(data['max_food_id']),
+                     'days': data['days'],
+                     'meals': data['meals'],
+                     'meal_names': data['meal_names'].tolist(),
+                     'calories': data['calories'],
+                     'food_ids': data['food_ids']}
+    except FileNotFoundError:
+        return empty_index()
+    index['vocabulary'] = vocabulary
+    return index
+
+def save_search_index(mfp: MFPReport, index: dict) -> None:
+    """ write the index to disk """
+    vocabulary = sorted(index['tokens'])
+    lengths = [len(index['tokens'][token]) for token in vocabulary]
+    offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+    token_foods = np.fromiter((food_id for token in vocabulary for food_id in index['tokens'][token]),
+                              dtype=np.int32, count=int(offsets[-1]))
+    with open(mfp.search_index_file(), 'wb') as file:
+        np.savez(file,
+                 vocabulary=np.array(vocabulary, dtype=str),
+                 offsets=offsets,
+                 token_foods=token_foods,
+                 max_food_id=index['max_food_id'],
+                 days=index['days'],
+                 meals=index['meals'],
+                 meal_names=np.array(index['meal_names'], dtype=str),
+                 calories=index['calories'],
+                 food_ids=index['food_ids'])
+    index['vocabulary'] = vocabulary
+
+def update_search_index(mfp: MFPReport) -> dict:
+    """ add the foods and days that are not indexed yet
+
+        the words of a food come from the raw description and the clean_word
+        entry, so clean_word runs once per new food """
+
+    update_foods(mfp)
+    index = load_search_index(mfp)
+
+    df_foods = load_foods(mfp)
+    df_new_foods = df_foods[df_foods.index > index['max_food_id']]
+    tokens: Dict[str, List[int]] = index['tokens']
+    for food_id, description in df_new_foods['description'].items():
+        for token in tokenize(description) | tokenize(clean_word(description, mfp)):
+            tokens.setdefault(token, []).append(int(food_id))
+    if len(df_foods) > 0:
+        index['max_food_id'] = int(df_foods.index.max())
+
+    start_date = None
+    if len(index['days']) > 0:
+        start_date = EPOCH + dt.timedelta(days=int(index['days'][-1]) + 1)
+    df_entries = load_entries(mfp, start_date)
+
+    if len(df_entries) == 0 and len(df_new_foods) == 0:
+        return index
+
+    for meal in df_entries['meal'].unique():
+        if meal not in index['meal_names']:
+            index['meal_names'].append(meal)
+    meal_codes = {meal: code for code, meal in enumerate(index['meal_names'])}
+    index['days'] = np.concatenate([index['days'], ((df_entries.index - EPOCH).days).values.astype(np.int32)])
+    index['meals'] = np.concatenate([index['meals'], df_entries['meal'].map(meal_codes).values.astype(np.int16)])
+    index['calories'] = np.concatenate([index['calories'], df_entries['calories'].values.astype(np.int32)])
+    index['food_ids'] = np.concatenate([index['food_ids'], df_entries['food_id'].values.astype(np.int32)])
+
+    save_search_index(mfp, index)
+    logger.info(f"search index: {len(df_new_foods)} new foods, {len(df_entries)} new entries")
+    return index
+
+def match_foods(index: dict, terms: list) -> np.ndarray:
+    """ food ids matching all terms, a term ending in * is a prefix """
+    if 'vocabulary' not in index:
+        index['vocabulary'] = sorted(index['tokens'])
+    vocabulary = index['vocabulary']
+    result = None
+    for term in terms:
+        term = term.lower()
+        if term.endswith('*'):
+            prefix = term[:-1]
+            first = bisect.bisect_left(vocabulary, prefix)
+            last = bisect.bisect_left(vocabulary, prefix + '\uffff')
+            foods = set()
+            for token in vocabulary[first:last]:
+                foods.update(index['tokens'][token])
+        else:
+            foods = set(index['tokens'].get(term, []))
+        result = foods if result is None else result & foods
+    return np.array(sorted(result or []), dtype=np.int32)
+
+def period_codes(index: dict, period: str) -> tuple:
+    """ period number for every day in the index and the period names, calculated once per index """
+    cache = index.setdefault('periods', {})
+    key = (period, len(index['days']))
+    if key not in cache:
+        first_day = int(index['days'].min()) if len(index['days']) > 0 else 0
+        last_day = int(index['days'].max()) if len(index['days']) > 0 else 0
+        labels = pd.to_datetime(np.arange(first_day, last_day + 1), unit='D').strftime(ROLLUP_PERIODS[period])
+        codes, names = pd.factorize(labels)
+        cache[key] = (first_day, codes, names)
+    return cache[key]
+
+def search(index: dict, terms: list, period: str='year', start_date=None, end_date=None, meal: str=None) -> DataFrame:
+    """ entries, days and calories per period for the foods matching the terms """
+    mask = np.isin(index['food_ids'], match_foods(index, terms))
+    if start_date is not None:
+        mask &= index['days'] >= (pd.Timestamp(start_date) - EPOCH).days
+    if end_date is not None:
+        mask &= index['days'] <= (pd.Timestamp(end_date) - EPOCH).days
+    if meal is not None:
+        mask &= index['meals'] == (index['meal_names'].index(meal) if meal in index['meal_names'] else -1)
+
+    days = index['days'][mask]
+    first_day, codes, names = period_codes(index, period)
+    day_codes = codes[days - first_day]
+    df_result = pd.DataFrame({'entries': np.bincount(day_codes, minlength=len(names)),
+                              'days': np.bincount(codes[np.unique(days) - first_day], minlength=len(names)),
+                              'calories': np.bincount(day_codes, weights=index['calories'][mask], minlength=len(names)).astype(np.int64)},
+                             index=pd.Index(names, name='period'))
+    return df_result[df_result['entries'] > 0]
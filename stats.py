@@ -0,0 +1,199 @@
+""" materialized statistics over the pivoted myfitnesspal totals """
+# pylint: disable=line-too-long
+# pylint: disable=logging-fstring-interpolation
+
+import json
+import logging
+import datetime as dt
+
+import pandas as pd
+from pandas import DataFrame
+
+from mfp import MFPReport
+
+logger = logging.getLogger(__name__)
+
+
+def read_header(filename: str) -> dict:
+    """ the json header next to a materialized file, empty when there is none """
+    try:
+        with open(f"{filename}.json", encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_header(filename: str, header: dict) -> None:
+    """ json header next to a materialized file, written with the whole file """
+    with open(f"{filename}.json", 'w', encoding='utf-8') as file:
+        json.dump(header, file)
+
+def rolling_columns(mfp: MFPReport) -> list:
+    """ names of the materialized columns, e.g. netcalories_ma7 """
+    return [f"{metric}_ma{window}" for metric in mfp.rolling_metrics for window in mfp.rolling_windows]
+
+def daily_metrics(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame=None) -> DataFrame:
+    """ one row per calendar day with the metrics to roll """
+
+    df_daily = pd.DataFrame(index=df_mfp.index)
+    for metric in mfp.rolling_metrics:
+        if metric in df_mfp:
+            df_daily[metric] = df_mfp[metric]
+        elif df_body is not None and metric in df_body:
+            # last known measurement, so values do not change when new days are appended
+            df_daily[metric] = df_body[metric].reindex(df_mfp.index.union(df_body.index)).ffill()
+        else:
+            logger.warning(f"'{metric}' not in dataset, rolling statistics can not be calculated.")
+            df_daily[metric] = float('nan')
+    idx = pd.date_range(df_daily.index.min(), df_daily.index.max())
+    return df_daily.reindex(idx)
+
+def calc_rolling(mfp: MFPReport, df_daily: DataFrame) -> DataFrame:
+    """ trailing rolling means, a row only depends on the days before it """
+    df_roll = pd.DataFrame(index=df_daily.index)
+    for metric in mfp.rolling_metrics:
+        for window in mfp.rolling_windows:
+            df_roll[f"{metric}_ma{window}"] = df_daily[metric].rolling(window=window, min_periods=window).mean()
+    df_roll.index.name = 'date'
+    return df_roll
+
+def rolling_file_frame(mfp: MFPReport, df_daily: DataFrame) -> DataFrame:
+    """ the rolling statistics with the daily values they were calculated from, as stored """
+    df_roll = calc_rolling(mfp, df_daily)
+    return pd.concat([df_daily[mfp.rolling_metrics].set_axis(df_roll.index), df_roll], axis=1)
+
+def update_rolling(mfp: MFPReport, df_mfp: DataFrame, df_body: DataFrame=None, rebuild: bool=False) -> DataFrame:
+    """ bring the materialized rolling statistics up to date and return them
+
+        the file keeps the daily values next to the statistics. The days from the first
+        day whose values changed, like a later weighing or a resync, and the new days are
+        calculated again. The file is rebuilt when the windows, metrics or DERIVED_SETTINGS
+        in the config changed """
+
+    df_daily = daily_metrics(mfp, df_mfp, df_body)
+
+    df_file = None
+    if not rebuild:
+        try:
+            df_file = pd.read_csv(mfp.rolling_csv_file(), index_col='date', parse_dates=['date'])
+        except FileNotFoundError:
+            pass
+    if df_file is not None and (list(df_file.columns) != mfp.rolling_metrics + rolling_columns(mfp) or df_file.index.min() != df_daily.index.min()
+                                or read_header(mfp.rolling_csv_file()).get('derived') != mfp.derived_digest()):
+        logger.info("rolling statistics are stale, rebuilding")
+        df_file = None
+
+    if df_file is None or len(df_file) == 0:
+        df_file = rolling_file_frame(mfp, df_daily)
+        df_file.to_csv(mfp.rolling_csv_file(), float_format='%.2f')
+        write_header(mfp.rolling_csv_file(), {'derived': mfp.derived_digest()})
+        return df_file[rolling_columns(mfp)]
+
+    # the first stored day whose daily values changed, else the day after the stored days
+    df_stored = df_file[mfp.rolling_metrics]
+    df_current = df_daily[mfp.rolling_metrics].reindex(df_stored.index)
+    changed = ~(((df_current - df_stored).abs() < 0.006) | (df_current.isna() & df_stored.isna())).all(axis=1)
+    last_date = df_file.index.max()
+    first_changed = df_stored.index[changed].min() if changed.any() else last_date + dt.timedelta(days=1)
+    if first_changed > df_daily.index.max():
+        return df_file[rolling_columns(mfp)]
+
+    tail_start = first_changed - dt.timedelta(days=max(mfp.rolling_windows) - 1)
+    df_new = rolling_file_frame(mfp, df_daily[df_daily.index >= tail_start])
+    df_new = df_new[df_new.index >= first_changed]
+    if first_changed > last_date:
+        df_new.to_csv(mfp.rolling_csv_file(), mode='a', header=False, float_format='%.2f')
+        logger.info(f"rolling statistics: appended {len(df_new)} days")
+        df_file = pd.concat([df_file, df_new])
+    else:
+        df_file = pd.concat([df_file[df_file.index < first_changed], df_new])
+        df_file.to_csv(mfp.rolling_csv_file(), float_format='%.2f')
+        logger.info(f"rolling statistics: recalculated from {first_changed:%Y-%m-%d}, the daily values changed")
+    return df_file[rolling_columns(mfp)]
+
+def query_rolling(df_roll: DataFrame, start_date=None, end_date=None, metric: str=None) -> DataFrame:
+    """ select a date range (and optionally one metric) from the rolling statistics """
+    if start_date is not None:
+        df_roll = df_roll[df_roll.index >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        df_roll = df_roll[df_roll.index <= pd.Timestamp(end_date)]
+    if metric is not None:
+        df_roll = df_roll[[x for x in df_roll.columns if x.rsplit('_ma', 1)[0] == metric]]
+    return df_roll
+
+ROLLUP_PERIODS = {
+    'day': '%Y-%m-%d',
+    'week': '%G-W%V',     # ISO week
+    'month': '%Y-%m',
+    'year': '%Y',
+}
+
+def calc_rollup(df_mfp: DataFrame, granularities: list=None) -> DataFrame:
+    """ sum, count and mean per category for every day, iso-week, month and year
+
+        the meal totals are categories in the pivot, so the cube is split by meal as well """
+    parts = {}
+    for granularity in granularities or ROLLUP_PERIODS:
+        df_group = df_mfp.groupby(df_mfp.index.strftime(ROLLUP_PERIODS[granularity]))
+        df_part = pd.concat({'sum': df_group.sum().stack(), 'count': df_group.count().stack()}, axis=1)
+        df_part.index.names = ['period', 'category']
+        parts[granularity] = df_part
+    df_cube = pd.concat(parts, names=['granularity'])
+    df_cube['mean'] = df_cube['sum'] / df_cube['count'].where(df_cube['count'] > 0)
+    return df_cube.sort_index()
+
+def load_rollup(mfp: MFPReport) -> DataFrame:
+    """ read the persisted cube, later rows replace earlier rows for the same period """
+    df_cube = pd.read_csv(mfp.rollup_csv_file(), dtype={'period': str}, index_col=['granularity', 'period', 'category'])
+    return df_cube[~df_cube.index.duplicated(keep='last')].sort_index()
+
+def update_rollup(mfp: MFPReport, df_mfp: DataFrame, rebuild: bool=False) -> DataFrame:
+    """ bring the rollup cube up to date and return it
+
+        only the periods touched by days after the last day in the cube are
+        recalculated, their rows are appended to the file. The cube is rebuilt
+        when DERIVED_SETTINGS in the config changed """
+
+    df_cube = None
+    if not rebuild:
+        try:
+            df_cube = load_rollup(mfp)
+        except FileNotFoundError:
+            pass
+    if df_cube is not None and read_header(mfp.rollup_csv_file()).get('derived') != mfp.derived_digest():
+        logger.info("rollup was calculated with other derived totals, rebuilding")
+        df_cube = None
+
+    if df_cube is None or 'day' not in df_cube.index.get_level_values('granularity'):
+        df_cube = calc_rollup(df_mfp)
+        df_cube.to_csv(mfp.rollup_csv_file())
+        write_header(mfp.rollup_csv_file(), {'derived': mfp.derived_digest()})
+        return df_cube
+
+    last_day = pd.Timestamp(df_cube.loc['day'].index.get_level_values('period').max())
+    if last_day >= df_mfp.index.max():
+        return df_cube
+
+    # whole periods from the first new day, a year is the longest period
+    first_new = df_mfp.index[df_mfp.index > last_day].min()
+    df_tail = df_mfp[df_mfp.index >= first_new - dt.timedelta(days=366)]
+    parts = {}
+    for granularity, period_format in ROLLUP_PERIODS.items():
+        df_period = df_tail[df_tail.index.strftime(period_format) >= first_new.strftime(period_format)]
+        parts[granularity] = calc_rollup(df_period, [granularity]).loc[granularity]
+    df_new = pd.concat(parts, names=['granularity'])
+    df_new.to_csv(mfp.rollup_csv_file(), mode='a', header=False)
+    logger.info(f"rollup: updated {len(df_new)} rows from {first_new:%Y-%m-%d}")
+
+    df_cube = pd.concat([df_cube, df_new])
+    return df_cube[~df_cube.index.duplicated(keep='last')].sort_index()
+
+def rollup_value(df_cube: DataFrame, granularity: str, period: str, category: str, stat: str='mean') -> float:
+    """ one value from the cube, NaN when the period or category is unknown """
+    try:
+        return df_cube.at[(granularity, str(period), category), stat]
+    except KeyError:
+        return float('nan')
+
+def rollup_periods(df_cube: DataFrame, granularity: str, stat: str='mean') -> DataFrame:
+    """ periods as rows and categories as columns for one granularity """
+    return df_cube.loc[granularity, stat].unstack('category')
@@ -0,0 +1,150 @@
+""" synthetic myfitnesspal days for benchmarks and offline runs """
+# pylint: disable=too-few-public-methods
+
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from types import SimpleNamespace
+import datetime as dt
+
+import csvio
+from mfp import MFPReport
+
+FOODS = [
+    ("Oatmeal, rolled oats, 40 g", 150), ("Banana, raw, 1 medium", 105),
+    ("Greek yoghurt - Fage total 0%, 150 g", 80), ("Coffee - black, 1 cup", 2),
+    ("Bread - whole wheat, 1 slice", 80), ("Cheese - gouda, 30 g", 110),
+    ("Egg - boiled, 1 large", 78), ("Apple - raw, 1 medium", 95),
+    ("Pizza - margherita, 1 slice", 270), ("Pizza - pepperoni, 1 slice", 310),
+    ("Chicken breast - grilled, 150 g", 230), ("Rice - white cooked, 1 cup", 205),
+    ("Pasta - spaghetti cooked, 1 cup", 220), ("Salmon - baked, 150 g", 310),
+    ("Broccoli - steamed, 1 cup", 55), ("Salad - mixed greens, 1 bowl", 35),
+    ("Olive oil, 1 tbsp", 120), ("Potatoes - boiled, 200 g", 170),
+    ("Soup - tomato, 1 bowl", 140), ("Sandwich - ham and cheese, 1", 350),
+    ("Chocolate - dark 70%, 20 g", 120), ("Crisps - salted, 1 bag", 160),
+    ("Almonds - raw, 30 g", 170), ("Cookie - chocolate chip, 1", 80),
+    ("Beer - Heineken, 330 ml", 140), ("Wine - red, 1 glass", 125),
+    ("Gin and tonic, 1 glass", 170), ("Orange juice, 250 ml", 110),
+]
+
+MEALS = {
+    'breakfast': (1, 3, range(0, 8)),
+    'lunch': (1, 3, range(2, 22)),
+    'dinner': (1, 4, range(8, 20)),
+    'snacks': (0, 3, range(18, 24)),
+    'party': (0, 3, range(24, 27)),
+}
+
+class SyntheticMeal:
+    """ a meal or exercise list, as returned by myfitnesspal """
+
+    def __init__(self, name: str, entries: list):
+        self.name = name
+        self.entries = entries
+
+    def get_as_list(self) -> list:
+        """ entries as dictionaries """
+        return self.entries
+
+class SyntheticDay:
+    """ a diary day with the attributes MFPReport.day_rows reads """
+
+    def __init__(self, date: dt.date, seed: int=0):
+        rng = random.Random(date.toordinal() * 1000 + seed)
+        totals = {'calories': 0, 'carbohydrates': 0, 'fat': 0,
+                  'protein': 0, 'sodium': 0, 'sugar': 0}
+        self.meals = []
+        for meal, (least, most, choices) in MEALS.items():
+            entries = []
+            for _ in range(rng.randint(least, most)):
+                name, calories = FOODS[rng.choice(choices) % len(FOODS)]
+                nutrition = {'calories': calories,
+                             'carbohydrates': round(calories * 0.12),
+                             'fat': round(calories * 0.04),
+                             'protein': round(calories * 0.05),
+                             'sodium': round(calories * 0.8),
+                             'sugar': round(calories * 0.03)}
+                entries.append({'name': name, 'nutrition_information': nutrition})
+                for key, value in nutrition.items():
+                    totals[key] += value
+            self.meals.append(SyntheticMeal(meal, entries))
+
+        exercises = [{'name': 'MFP iOS calorie adjustment',
+                      'nutrition_information': {'minutes': 1,
+                                                'calories burned': rng.randint(0, 400)}}]
+        if rng.random() < 0.3:
+            exercises.append({'name': 'Running (jogging), 8 kph',
+                              'nutrition_information': {'minutes': 30,
+                                                        'calories burned': rng.randint(200, 400)}})
+        self.exercises = [SyntheticMeal('cardiovascular', exercises)]
+        self.totals = totals if totals['calories'] > 0 else {}
+        self.goals = {'calories': 2000}
+
+class FakeServiceError(Exception):
+    """ a failed request, .response looks like the requests.Response of an HTTPError """
+
+    def __init__(self, status_code: int, retry_after: float=None):
+        super().__init__(f"{status_code} from fake myfitnesspal")
+        headers = {} if retry_after is None else {'Retry-After': str(retry_after)}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+class FakeClient:
+    """ local stand-in for myfitnesspal.Client that serves SyntheticDay
+
+        latency, jitter : seconds per request, jitter is added uniformly 0..jitter
+        error_rate      : fraction of requests failing with a 503
+        rate_limit      : requests per second before answering 429, 0 is unlimited
+        every call is recorded in .latencies, failures in .errors and .throttled """
+
+    def __init__(self, latency: float=0.05, jitter: float=0.02, error_rate: float=0.0,
+                 rate_limit: float=0, seed: int=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()        # to_csv requests from several threads
+        self.calls: deque = deque()
+        self.latencies: list = []
+        self.errors = 0
+        self.throttled = 0
+
+    def get_date(self, date: dt.date) -> SyntheticDay:
+        """ the synthetic diary of one day, after the configured delay """
+        start = time.perf_counter()
+        try:
+            with self.lock:
+                if self.rate_limit > 0:
+                    while len(self.calls) > 0 and self.calls[0] < start - 1:
+                        self.calls.popleft()
+                    if len(self.calls) >= self.rate_limit:
+                        self.throttled += 1
+                        raise FakeServiceError(429, retry_after=1)
+                    self.calls.append(start)
+                delay = self.latency + self.rng.uniform(0, self.jitter)
+                failed = self.rng.random() < self.error_rate
+            time.sleep(delay)
+            if failed:
+                with self.lock:
+                    self.errors += 1
+                raise FakeServiceError(503)
+            return SyntheticDay(date, self.seed)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+def write_diary(mfp: MFPReport, start_date: dt.date, days: int, seed: int=0) -> None:
+    """ write a complete diary csv of synthetic days to mfp.mfp_csv_file,
+        compressed by its extension """
+    Path(mfp.mfp_csv_file).unlink(missing_ok=True)
+    index = {'dates': [], 'offsets': []}
+    with csvio.Appender(mfp.mfp_csv_file, index, mfp.csv_compression) as appender:
+        header = [["date", "type", "description", "calories", "details"]]
+        appender.add(None, mfp.serialize_rows(header))
+        for looper in range(days):
+            date = start_date + dt.timedelta(looper)
+            rows = mfp.day_rows(date, SyntheticDay(date, seed))
+            appender.add(f"{date:%Y-%m-%d}", mfp.serialize_rows(rows))
+    mfp.save_index(index)
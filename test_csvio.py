@@ -0,0 +1,63 @@
+""" plain, gzip and zstd csv files through append and ranged load_df, with the date index """
+
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import csvio
+from conftest import SUFFIXES, DAYS, report, content
+from synthetic import FakeClient, write_diary
+
+
+def test_append(appended):
+    """ appending gives the same content and index as writing at once """
+    mfp, expected = appended
+    assert content(mfp) == content(expected)
+    assert mfp.load_index()['dates'] == expected.load_index()['dates']
+    assert mfp.load_index()['offsets'] == expected.load_index()['offsets']
+
+class FailingClient(FakeClient):
+    """ serves the days before fail_date, then fails for good """
+
+    def __init__(self, fail_date: dt.date):
+        super().__init__(latency=0, jitter=0)
+        self.fail_date = fail_date
+
+    def get_date(self, date: dt.date):
+        if date >= self.fail_date:
+            raise RuntimeError("killed")
+        return super().get_date(date)
+
+@pytest.mark.usefixtures('small_members')
+@pytest.mark.parametrize('suffix', SUFFIXES)
+def test_append_interrupted(tmp_path, monkeypatch, suffix):
+    """ days added before a run is killed are on disk,
+        even when it cannot close the file or save the index """
+    start_date = dt.date.today() - dt.timedelta(days=DAYS)
+    mfp = report(tmp_path, suffix)
+    write_diary(mfp, start_date, 3)
+    monkeypatch.setattr(csvio.Appender, 'close', lambda self: self.file.close())
+    monkeypatch.setattr(type(mfp), 'save_index', lambda self, index: None)
+    with pytest.raises(RuntimeError):
+        mfp.to_csv(client=FailingClient(start_date + dt.timedelta(days=DAYS - 5)))
+
+    Path(mfp.index_file()).unlink()
+    expected = [f"{start_date + dt.timedelta(days=x):%Y-%m-%d}" for x in range(DAYS - 5)]
+    assert mfp.load_index()['dates'] == expected
+
+@pytest.mark.parametrize('rebuild', [False, True])
+def test_load_range(appended, rebuild):
+    """ a date range reads the same rows as the whole file,
+        also with an index rebuilt from the csv """
+    mfp, _ = appended
+    if rebuild:
+        Path(mfp.index_file()).unlink()
+    df_all = mfp.load_df()
+    for offset, length in [(0, 1), (3, 7), (DAYS - 5, 5), (DAYS // 2 - 1, 3)]:
+        start_date = pd.Timestamp(dt.date.today() - dt.timedelta(days=DAYS - offset))
+        end_date = start_date + pd.Timedelta(days=length - 1)
+        df_range = mfp.load_df(start_date, end_date, cache=False)
+        expected = df_all[(df_all.index >= start_date) & (df_all.index <= end_date)]
+        pd.testing.assert_frame_equal(df_range, expected)
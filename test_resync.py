@@ -0,0 +1,52 @@
+""" resync of plain, gzip and zstd csv files """
+
+import datetime as dt
+from pathlib import Path
+
+import pandas as pd
+
+from conftest import DAYS, client, content
+from synthetic import FakeClient
+
+
+def test_resync_unchanged(appended):
+    """ resync of days that did not change leaves the file alone """
+    mfp, expected = appended
+    before = open(mfp.mfp_csv_file, 'rb').read()
+    result = mfp.resync(days=DAYS - 2, client=client())
+    assert result == {'checked': DAYS - 2, 'changed': 0, 'rewritten': 0}
+    assert open(mfp.mfp_csv_file, 'rb').read() == before
+    assert content(mfp) == content(expected)
+
+def test_resync_changed(appended):
+    """ resync rewrites the changed days and keeps the days before them """
+    mfp, _ = appended
+    first_changed = mfp.last_csv_date() - dt.timedelta(days=3)
+    head = content(mfp)[:mfp.date_offset(mfp.load_index(), first_changed)]
+    result = mfp.resync(days=4, client=FakeClient(latency=0, jitter=0, seed=1))
+    assert result['changed'] == 4
+    assert content(mfp).startswith(head)
+    index = mfp.load_index()
+    assert index['end'] == len(content(mfp))
+    df_days = mfp.load_df(pd.Timestamp(first_changed), None, cache=False)
+    expected = [mfp.last_csv_date() - dt.timedelta(days=x) for x in range(3, -1, -1)]
+    assert sorted(set(df_days.index.date)) == expected
+
+def test_resync_not_today(appended):
+    """ resync stops at yesterday like to_csv, today is not complete yet """
+    mfp, _ = appended
+    yesterday = dt.date.today() - dt.timedelta(days=1)
+    result = mfp.resync(start_date=yesterday - dt.timedelta(days=1), end_date=dt.date.today(),
+                        client=FakeClient(latency=0, jitter=0, seed=1))
+    assert result['checked'] == 2
+    assert mfp.last_csv_date() == yesterday
+
+def test_resync_derived_files(appended):
+    """ the files built from the csv are removed when days changed, kept otherwise """
+    mfp, _ = appended
+    for filename in mfp.derived_files():
+        Path(filename).touch()
+    mfp.resync(days=4, client=client())
+    assert all(Path(x).is_file() for x in mfp.derived_files())
+    mfp.resync(days=4, client=FakeClient(latency=0, jitter=0, seed=1))
+    assert not any(Path(x).is_file() for x in mfp.derived_files())
@@ -0,0 +1,173 @@
+""" a warm process that runs cmdline commands without paying for the imports every time
+
+    python worker.py                 # start, imports and warms pandas, matplotlib, PyPDF2, ...
+    python cmdline.py combined 4     # forwarded to the worker when it listens, else runs here
+
+    every command runs in a fork of the warm process, with the stdin, stdout and stderr
+    of the calling cmdline.py passed over the socket, so output, exit code, working
+    directory and environment are those of the caller and no state is kept between runs
+"""
+# pylint: disable=import-outside-toplevel
+# pylint: disable=broad-except
+
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import time
+import traceback
+
+# header of a request, the length of the json that follows the passed file descriptors
+HEADER = struct.Struct('!Q')
+
+
+def socket_path() -> str:
+    """ MFP_WORKER_SOCKET, else a socket per user in XDG_RUNTIME_DIR or the temp directory """
+    if os.environ.get('MFP_WORKER_SOCKET'):
+        return os.environ['MFP_WORKER_SOCKET']
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory, f"mfp-worker-{os.getuid()}.sock")
+
+def forward(args: list, path: str=None):
+    """ run args in the worker listening on path, returns the exit code or None without a worker """
+    path = path or socket_path()
+    if not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+    except OSError:
+        client.close()
+        return None     # a socket left behind by a worker that stopped
+
+    with client:
+        request = json.dumps({'args': args, 'cwd': os.getcwd(),
+                              'env': dict(os.environ)}).encode('utf-8')
+        socket.send_fds(client, [HEADER.pack(len(request))], [0, 1, 2])
+        client.sendall(request)
+        reply = client.makefile('r', encoding='utf-8')
+        pid = json.loads(reply.readline())['pid']
+        try:
+            answer = reply.readline()
+        except KeyboardInterrupt:
+            os.kill(pid, signal.SIGINT)
+            answer = reply.readline()
+        # a run that died without answering counts as failed
+        return json.loads(answer)['code'] if answer else 1
+
+def receive(connection: socket.socket) -> dict:
+    """ the request of a client, its stdin, stdout and stderr become ours """
+    data, fds, _, _ = socket.recv_fds(connection, HEADER.size, 3)
+    length, = HEADER.unpack(data)
+    body = b''
+    while len(body) < length:
+        part = connection.recv(length - len(body))
+        if not part:
+            raise ConnectionError("request cut short")
+        body += part
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for target, fd in enumerate(fds):
+        os.dup2(fd, target)
+        os.close(fd)
+    return json.loads(body)
+
+def handle(connection: socket.socket) -> None:
+    """ run one request in this forked process and exit with its code """
+    code = 1
+    try:
+        # subprocesses like wkhtmltopdf are waited for
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        connection.sendall(json.dumps({'pid': os.getpid()}).encode('utf-8') + b"\n")
+        request = receive(connection)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        time.tzset()
+        sys.argv = ['cmdline.py'] + request['args']
+
+        import cmdline
+        try:
+            cmdline.run(request['args'])
+            code = 0
+        except SystemExit as error:
+            code = error.code if isinstance(error.code, int) else int(error.code is not None)
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            # os._exit does not wait for threads,
+            # a background sync would stop mid-fetch with a stale index
+            from mfp import wait_for_sync
+            wait_for_sync()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            connection.sendall(json.dumps({'code': code}).encode('utf-8') + b"\n")
+        finally:
+            os._exit(code)      # pylint: disable=protected-access
+
+def warm() -> None:
+    """ import everything a command needs and draw once,
+        so font lookup and pdf backend are loaded """
+    from io import BytesIO
+    import matplotlib.pyplot as plt
+    import commands     # pylint: disable=unused-import
+    import cmdline      # pylint: disable=unused-import
+    import pdftable     # pylint: disable=unused-import
+
+    figure = plt.figure()
+    figure.text(0.5, 0.5, "warm", fontweight='bold')
+    figure.savefig(BytesIO(), format='pdf')
+    figure.savefig(BytesIO(), format='png')
+    plt.close(figure)
+
+def serve(path: str) -> None:
+    """ accept requests on path until stopped, one fork per request """
+    start = time.perf_counter()
+    warm()
+    print(f"worker ready on {path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(16)
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)     # finished runs are reaped by the kernel
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        while True:
+            connection, _ = server.accept()
+            credentials = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                                struct.calcsize('3i'))
+            uid = struct.unpack('3i', credentials)[1]
+            if uid != os.getuid():
+                connection.close()
+                continue
+            if os.fork() == 0:
+                server.close()
+                handle(connection)
+            connection.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def main():
+    """ start the worker from the command line """
+    parser = argparse.ArgumentParser(
+        description="keep the libraries of cmdline.py imported and run its commands")
+    parser.add_argument("--socket", type=str, default=None,
+                        help="path of the unix socket, default per user")
+    args = parser.parse_args()
+    serve(args.socket or socket_path())
+
+if __name__ == "__main__":
+    main()